@@ -1,6 +1,17 @@
+from collections import Counter, namedtuple
+from copy import copy
 from datetime import datetime
-from random import randint, shuffle, choice, choices
+import random
 from statistics import median
+from time import perf_counter
+
+from numzilla_grid import BitboardGrid, ListGrid
+from numzilla_index import MatchIndexMixin
+
+try:
+    from numzilla_numpy import NumpyGrid
+except ImportError: # numpy is optional, only needed for the numpy grid backend
+    NumpyGrid = None
 
 DEBUG = 0 # PRINTS DEBUG INFO TO CONSOLE
           # -1 = PRINT DEBUG FOR SOLVE ONLY
@@ -9,8 +20,16 @@ DEBUG = 0 # PRINTS DEBUG INFO TO CONSOLE
           # 2 = PRINTS GRID EACH STEP
 
 # helper methods
-def rand():
-    return randint(1, 9)
+def rand(rng=random):
+    return rng.randint(1, 9)
+
+class GlobalRandom:
+    # the random module's global state behind the rng interface, the default rng
+    # of a Puzzle (an instance rather than the module so puzzles still copy and pickle)
+    randint = staticmethod(random.randint)
+    shuffle = staticmethod(random.shuffle)
+    choice = staticmethod(random.choice)
+    choices = staticmethod(random.choices)
 
 def output(msg):
     out_fmt = '{0} : {1}'
@@ -23,15 +42,48 @@ def output(msg):
         msg = out_fmt.format(timestamp, msg)
     print(msg)
 
+# statistics of one played game, see Puzzle.play (runtime in seconds, None when not timed). status is
+# finished (grid cleared), partial (fully_solve=False), interrupted (ctrl+c) or unterminated, limit the budget that stopped an
+# unterminated game (steps, time or multiset_repeats) and repeats the scrambles dealing a multiset of live values seen before
+GameResult = namedtuple('GameResult', ['steps', 'max_rows', 'matches', 'builds', 'scrambles', 'score', 'multipliers', 'runtime',
+                                       'status', 'limit', 'repeats'], defaults=(None, 'finished', None, 0))
+
+# random 64 bit key per value, play's rolling state hash is the sum of the keys of the live values
+STATE_KEYS = tuple(random.Random(val).getrandbits(64) for val in range(10))
+STATE_MASK = (1 << 64) - 1
+
+# a candidate match and what playing it would do, see Puzzle.hints (kind is PAIR or SUM,
+# rows the number of rows it would remove, reused when it shares a value with an earlier match)
+Hint = namedtuple('Hint', ['m1', 'm2', 'kind', 'rows', 'score', 'reused'])
+
+# state restored when undoing an operation, values, the match index and the row
+# counts are replaced rather than changed in place by everything except match and build
+UNDO_STATE = ('score', 'num_rows', 'values', '_matches', '_match_keys', '_cells', '_row_pairs', '_col_pairs',
+              '_grid_matches', '_grid_tally', '_row_live', '_row_count', '_build_count', '_consecutive_builds', '_num_count',
+              '_enable_build', '_enable_scramble', '_prev_cleanup', '_start_scramble_rows', '_multiplier')
+
 def cleanup(func):
     def wrapper(self, *func_args, **func_kwargs):
+        self.log_undo(func.__name__)
         func(self, *func_args, **func_kwargs)
-        self.find_all()
         self.cleanup(func.__name__)
-        if self.debug == 2:
+        if self.renderer is not None:
+            self.renderer.render(self)
+        elif self.debug == 2:
             self.display()
+    return profiled(wrapper, func.__name__)
+
+def profiled(func, name=None):
+    # times the call into self.profile (see numzilla_profile) when the puzzle has one,
+    # otherwise costs a single check
+    name = func.__name__ if name is None else name
+    def wrapper(self, *func_args, **func_kwargs):
+        if self.profile is None:
+            return func(self, *func_args, **func_kwargs)
+        return self.profile.call(name, self, func, func_args, func_kwargs)
     return wrapper
 
+
 ### CONVENTIONS ###
 #  col = 1 indexed column number (excel-style)
 #  row = 1 indexed row number (excel-style)
@@ -66,46 +118,102 @@ class Defaults:
     multipliers_weights_current_high = [0.1, 0.2, 0.3, 0.2, 0.1, 0.06, 0.04]
     weighted_multiplier = True
 
+    backend = 'list' # grid storage backend, see GRID_BACKENDS
+    constructive_shuffle = False # when a shuffle holds no match, move a partner next to a value instead of reshuffling
 
-class Puzzle:
 
-    def __init__(
+# Defaults a single game can override with Puzzle(config={name: value})
+CONFIG = ('scramble_rows', 'build_count_min', 'build_count_max', 'build_scramble_threshold', 'row_match',
+          'col_match', 'reuse_match', 'sum_value', 'single_score', 'row_score', 'sum_multiplier',
+          'multiplier', 'multiplier_population', 'multipliers_weights_current_low',
+          'multipliers_weights_current_high', 'weighted_multiplier', 'constructive_shuffle')
+
+
+# grid storage backends, see numzilla_grid
+GRID_BACKENDS = {
+    'list': ListGrid,
+    'bitboard': BitboardGrid,
+    'numpy': NumpyGrid
+}
+
+
+class Puzzle(MatchIndexMixin):
+
+    __slots__ = (
+        'debug', 'profile', 'renderer', '_grid', '_rng', '_max_width', '_num_start_rows', '_scramble_rows', '_build_count_min',
+        '_build_count_max', '_build_scramble_threshold', '_row_match', '_col_match', '_reuse_match',
+        '_sum_value', '_single_score', '_row_score', '_sum_multiplier', '_multiplier',
+        '_multiplier_population', '_multipliers_weights_current_low',
+        '_multipliers_weights_current_high', '_weighted_multiplier', '_constructive_shuffle', 'score', 'values', 'num_rows',
+        '_row_live', '_row_count',
+        '_build_count', '_consecutive_builds', '_num_count', '_enable_build', '_enable_scramble',
+        '_prev_cleanup', '_start_scramble_rows', '_undo')
+
+    def __init__( # pylint: disable=too-many-arguments,too-many-positional-arguments
             self, 
             debug=DEBUG, 
             max_width=Defaults.max_width, 
             num_start_rows=Defaults.num_start_rows,
-            test=False):
+            test=False,
+            backend=Defaults.backend,
+            values=None,
+            rng=None,
+            profile=None,
+            config=None,
+            renderer=None):
+
+        if GRID_BACKENDS.get(backend) is None:
+            raise ValueError('grid backend {0} is not available'.format(backend))
+        config = {} if config is None else config
+        unknown = [name for name in config if name not in CONFIG]
+        if unknown:
+            raise ValueError('unknown config {0}'.format(', '.join(unknown)))
+        settings = {name: config.get(name, getattr(Defaults, name)) for name in CONFIG}
 
         self.debug = debug
+        self.profile = profile # a Profile to record call counts and times into, None to skip profiling
+        self.renderer = renderer # a Renderer (see numzilla_render) drawing the grid after every operation
+        self._grid = GRID_BACKENDS[backend]
+        # every random draw of the game comes from rng (a random.Random or anything with
+        # its randint/shuffle/choice/choices), the random module's global state by default
+        self._rng = GlobalRandom() if rng is None else rng
         self._max_width = max_width
         self._num_start_rows = num_start_rows
-        self._scramble_rows = Defaults.scramble_rows
-        self._build_count_min = Defaults.build_count_min
-        self._build_count_max = Defaults.build_count_max
-        self._build_scramble_threshold = Defaults.build_scramble_threshold
+        self._scramble_rows = settings['scramble_rows']
+        self._build_count_min = settings['build_count_min']
+        self._build_count_max = settings['build_count_max']
+        self._build_scramble_threshold = settings['build_scramble_threshold']
 
-        self._row_match = Defaults.row_match
-        self._col_match = Defaults.col_match
-        self._reuse_match = Defaults.reuse_match
+        self._row_match = settings['row_match']
+        self._col_match = settings['col_match']
+        self._reuse_match = settings['reuse_match']
 
-        self._sum_value = Defaults.sum_value
+        self._sum_value = settings['sum_value']
 
-        self._single_score = Defaults.single_score
-        self._row_score = Defaults.row_score
-        self._sum_multiplier = Defaults.sum_multiplier
+        self._single_score = settings['single_score']
+        self._row_score = settings['row_score']
+        self._sum_multiplier = settings['sum_multiplier']
 
-        self._multiplier = Defaults.multiplier
-        self._multiplier_population = Defaults.multiplier_population
-        self._multipliers_weights_current_low = Defaults.multipliers_weights_current_low
-        self._multipliers_weights_current_high = Defaults.multipliers_weights_current_high
-        self._weighted_multiplier = Defaults.weighted_multiplier
+        self._multiplier = settings['multiplier']
+        self._multiplier_population = settings['multiplier_population']
+        self._multipliers_weights_current_low = settings['multipliers_weights_current_low']
+        self._multipliers_weights_current_high = settings['multipliers_weights_current_high']
+        self._weighted_multiplier = settings['weighted_multiplier']
+        self._constructive_shuffle = settings['constructive_shuffle']
 
         self.score = 0
 
         self.values = []
-        self._matches = []
+        self._matches = [] # (index, index) of every match, in scan order, see collect_matches
+        self._match_keys = [] # the position of each of _matches, sorted
+        self._cells = None # index -> (key, index, index) of every match holding it, sorted, see tally_matches
+        self._hints = None # (match, rows removed) -> [(key, index, index)] in index order, see rank_matches
+        self._filed = {} # key -> (match, rows removed) it is filed under
+        self._row_pairs = {} # index of first value -> index of next live value it matches (by index)
+        self._col_pairs = {} # index of first value -> index of next live value it matches (by column)
         self._grid_matches = 0
-        self._grid_value = 0
+        self._grid_tally = None # matches by index, reused by index, by column, reused by column
+        self._row_live = [] # number of live values in each row
         self._row_count = 0
         self._build_count = 0
         self._consecutive_builds = 0
@@ -114,33 +222,35 @@ class Puzzle:
         self._enable_scramble = False
         self._prev_cleanup = None
         self._start_scramble_rows = self._num_start_rows
+        self.num_rows = self._num_start_rows
+        self._undo = None # undo log, only kept between snapshot() and restore()
 
-        self.generate(test)
+        self.generate(test, values)
 
     @cleanup
-    def generate(self, test=False):
-        self.values = []
+    def generate(self, test=False, values=None):
         self.num_rows = self._num_start_rows
+        if values is not None:
+            # a recorded starting grid (see numzilla_trace), used as is
+            self.values = self._grid.new(values)
+            self.find_all()
+            self.recount()
+            if self.debug > 0:
+                output('### GENERATE: LOADED')
+            return
+
+        self.values = []
         length = self._num_start_rows * self._max_width
         if not length % 2 == 0:
             length += 1
 
         for _ in range(int(length / 2)):
-            add = rand()
+            add = rand(self._rng)
             self.values.append(add)
             self.values.append(add)
-        self._grid_matches = 0
-
-        # if no matches exist, re-generate
-        while self._grid_matches == 0:
-            shuffle(self.values)
-            self.find_all()
-            if test:
-                self._grid_matches = 0
-                test = False
-            if self._grid_matches == 0:
-                if self.debug > 0:
-                    output('### GENERATE: NO MATCHES, REGENERATING')
+        self.values = self._grid.new(self.values)
+        self.deal(test, '### GENERATE: NO MATCHES, REGENERATING')
+        self.recount()
 
         if self.debug > 0:
             output('### GENERATE')
@@ -148,7 +258,14 @@ class Puzzle:
     @cleanup
     def build(self):
         self._build_count += 1
-        self.values += [val for val in self.values if val > 0]
+        tail = self._grid.live(self.values)
+        start = len(self.values)
+        first = start // self._max_width # the row the tail starts in
+        self.values = self._grid.extend(self.values, tail)
+        self._row_live = self._row_live[:first] + self._grid.row_counts(self.values[first * self._max_width:], self._max_width)
+        self._row_count = len(self._row_live)
+        self._num_count += len(tail)
+        self.extend_matches(start)
         if self.debug > 0:
             output('### BUILD')
 
@@ -157,32 +274,69 @@ class Puzzle:
             try:
                 self.scramble(test=True)
                 break
-            except RecursionError:
+            except ValueError:
                 self.generate()
 
     @cleanup
-    def scramble(self, test=False):
+    def scramble(self, test=False, values=None, multiplier=None):
+        # values and multiplier replay a recorded scramble (see numzilla_trace)
         self._build_count = 0
-        self.values = [val for val in self.values if val > 0]
-        self._grid_matches = 0
-
-        # if no matches exist, re-generate
-        while self._grid_matches == 0:
-            shuffle(self.values)
+        if values is not None:
+            self.values = self._grid.new(values)
             self.find_all()
-            if test:
-                self._grid_matches = 0
-                test = False
-            if self._grid_matches == 0:
-                if self.debug > 0:
-                    output('### SCRAMBLE: NO MATCHES, SCRAMBLING')
+        else:
+            self.values = self._grid.live(self.values)
+            self.deal(test, '### SCRAMBLE: NO MATCHES, SCRAMBLING')
 
-        self.set_score_multiplier()
-        self._start_scramble_rows = len(self.build_rows())
+        if multiplier is None:
+            self.set_score_multiplier()
+        else:
+            self._multiplier = multiplier
+        self.recount()
+        self._start_scramble_rows = self._row_count
 
         if self.debug > 0:
             output('### SCRAMBLE: NEW MULTIPLIER = {0}'.format(self._multiplier))
 
+    def deal(self, test, message):
+        # shuffle until the grid holds a match (test forces one more shuffle), then index it
+        self._rng.shuffle(self.values)
+        while test or not self.has_any_match():
+            if not self.can_match():
+                raise ValueError('no arrangement of the grid holds a match')
+            if self.debug > 0:
+                output(message)
+            if self._constructive_shuffle and not test:
+                self.place_match()
+            else:
+                self._rng.shuffle(self.values)
+            test = False
+        self.find_all()
+
+    def has_any_match(self):
+        # same as find_all() leaving grid_matches > 0, but stops at the first match
+        last = len(self.values) - 1
+        if last > 0 and self.values[0] > 0 and self.values[last] > 0 and self.is_match(self.values[0], self.values[last]):
+            return True
+        return self._grid.has_pairs(self.values, self._max_width, self._sum_value)
+
+    def can_match(self):
+        # whether any arrangement of the live values holds a match
+        counts = Counter(val for val in self.values if val > 0)
+        return any(count > 1 or (self._sum_value - val != val and self._sum_value - val in counts) for val, count in counts.items())
+
+    def place_match(self):
+        # swaps a random partner of a random value next to it, the rest of the shuffle stays
+        positions = {}
+        for index, val in enumerate(self.values):
+            positions.setdefault(val, []).append(index)
+        partners = {val: indices + positions.get(self._sum_value - val, []) if self._sum_value - val != val else indices
+                    for val, indices in positions.items()}
+        index = self._rng.choice([index for index, val in enumerate(self.values) if len(partners[val]) > 1])
+        partner = self._rng.choice([_index for _index in partners[self.values[index]] if _index != index])
+        beside = index + 1 if index + 1 < len(self.values) else index - 1
+        self.values[beside], self.values[partner] = self.values[partner], self.values[beside]
+
     def is_match(self, v1, v2):
         if v1 == v2:
             return 1
@@ -190,22 +344,32 @@ class Puzzle:
             return 2
         return 0
 
-    @cleanup
     def match(self, m1, m2):
-        i1 = self.index_from_col_row(*m1)
+        # m1 and m2 as (col, row), see match_index
+        self.match_index(self.index_from_col_row(*m1), self.index_from_col_row(*m2))
+
+    @cleanup
+    def match_index(self, i1, i2):
         v1 = self.values[i1]
-        i2 = self.index_from_col_row(*m2)
         v2 = self.values[i2]
         match = self.is_match(v1, v2)
 
         if match > 0:
             self.values[i1] *= -1
             self.values[i2] *= -1
+            self._row_live[i1 // self._max_width] -= 1
+            self._row_live[i2 // self._max_width] -= 1
+            self._num_count -= 2
+            if self._undo is not None:
+                self._undo[-1][4] = (i1, i2)
+            self.update_matches(i1, i2)
             single_count = 2
-            row_count = self.row_removal()
+            row_count = self.row_removal((i1 // self._max_width, i2 // self._max_width))
             score = self.score_match(match, single_count, row_count)
             self.score += score
             if self.debug > 0:
+                m1 = self.col_row_from_index(i1)
+                m2 = self.col_row_from_index(i2)
                 match_text = 'PAIR' if match == 1 else 'SUM'
                 if row_count > 0:
                     output('### MATCH: {0}: {1} & {2}: {3} | {4} + {5} ROW(s) REMOVED | SCORE: {6}'.format(m1, v1, m2, v2, match_text, row_count, score))
@@ -213,21 +377,35 @@ class Puzzle:
                     output('### MATCH: {0}: {1} & {2}: {3} | {4} | SCORE: {5}'.format(m1, v1, m2, v2, match_text, score))
         else:
             if self.debug > 0:
+                m1 = self.col_row_from_index(i1)
+                m2 = self.col_row_from_index(i2)
                 v1 = v1 if v1 > 0 else '_'
                 v2 = v2 if v2 > 0 else '_'
                 output('### MATCH: {0}: {1} & {2}: {3} | INVALID MATCH'.format(m1, v1, m2, v2))
 
-    def row_removal(self):
-        rows = self.build_rows()
-        self.values = []
-        rows_removed = 0
-        for row in rows:
-            if all(val < 0 for val in row):
-                rows_removed += 1
-            else:
-                self.values += row
-        self._row_count = len(self.build_rows())
-        return rows_removed
+    @profiled
+    def row_removal(self, rows=None):
+        # removes the rows (row numbers) left without live values, a match can only
+        # empty the rows it touched. without rows every row is recounted and checked
+        if rows is None:
+            self.recount()
+            rows = range(self._row_count)
+        rows_removed = sorted({row_num for row_num in rows if self._row_live[row_num] == 0})
+        if rows_removed:
+            self.values = self._grid.remove_rows(self.values, rows_removed, self._max_width)
+            row_live = list(self._row_live)
+            for row_num in reversed(rows_removed):
+                del row_live[row_num]
+            self._row_live = row_live
+            self._row_count = len(row_live)
+            self.shift_matches(rows_removed)
+        return len(rows_removed)
+
+    def recount(self):
+        # live values per row from scratch, for when the whole grid is replaced
+        self._row_live = self._grid.row_counts(self.values, self._max_width)
+        self._row_count = len(self._row_live)
+        self._num_count = sum(self._row_live)
 
     def score_match(self, match, single_count, row_count):
         # score match
@@ -238,11 +416,11 @@ class Puzzle:
         population = [multiplier for multiplier in self._multiplier_population if not multiplier == self._multiplier]
         if self._weighted_multiplier:
             if self._multiplier <= median(self._multiplier_population):
-                self._multiplier = choices(population, weights=self._multipliers_weights_current_low)[0]
+                self._multiplier = self._rng.choices(population, weights=self._multipliers_weights_current_low)[0]
             else:
-                self._multiplier = choices(population, weights=self._multipliers_weights_current_high)[0]
+                self._multiplier = self._rng.choices(population, weights=self._multipliers_weights_current_high)[0]
         else:
-            self._multiplier = choice(population)
+            self._multiplier = self._rng.choice(population)
 
     def cleanup(self, calling_method):
         if (calling_method == 'build') and (self._prev_cleanup == calling_method):
@@ -251,11 +429,6 @@ class Puzzle:
             self._consecutive_builds = 0
         self._prev_cleanup = calling_method
 
-        # generate matches
-        self._row_count = len(self.build_rows())
-        self._num_count = len([value for value in self.values if value > 0])
-        self.find_all()
-
         prev_build = self._enable_build
         prev_scramble = self._enable_scramble
 
@@ -288,14 +461,155 @@ class Puzzle:
             elif not self._enable_scramble and prev_scramble:
                 output('### o SCRAMBLE DISABLED')
 
+    ### STATE ###
+
+    @property
+    def matches(self):
+        # as ((col, row), (col, row)), built on every call
+        return [(self.col_row_from_index(i1), self.col_row_from_index(i2)) for i1, i2 in self._matches]
+
+    @property
+    def index_matches(self):
+        # as (index, index), what the index holds
+        return self._matches
+
+    def hints(self, k=1):
+        # the k best matches by immediate score (see Hint), a pair found both by index and by
+        # column only once. the matches are filed by impact the first time they're asked for,
+        # and from then on every match and build refiles only the ones it touched (undo drops
+        # them). there are only six impacts to rank (PAIR or SUM, removing 0, 1 or 2 rows),
+        # so a call only walks the k matches it returns
+        if self._hints is None:
+            self.rank_matches()
+        out = []
+        for match, rows in sorted(self._hints, key=lambda impact: self.score_match(impact[0], 2, impact[1]), reverse=True):
+            score = self.score_match(match, 2, rows)
+            seen = set()
+            for filed in self._hints[(match, rows)]:
+                if len(out) == k:
+                    return out
+                if filed[1:] not in seen:
+                    seen.add(filed[1:])
+                    out.append(Hint(self.col_row_from_index(filed[1]), self.col_row_from_index(filed[2]), 'PAIR' if match == 1 else 'SUM',
+                                    rows, score, self.reused(filed)))
+        return out
+
+    @property
+    def max_width(self):
+        return self._max_width
+
+    @property
+    def sum_value(self):
+        return self._sum_value
+
+    @property
+    def grid_matches(self):
+        return self._grid_matches
+
+    @property
+    def grid_value(self):
+        # every match valued _row_match or _col_match, by _reuse_match once more when it shares a value with an earlier one
+        if self._cells is None:
+            self.tally_matches()
+        by_index, reused_by_index, by_column, reused_by_column = self._grid_tally
+        return (self._row_match * (by_index + reused_by_index * self._reuse_match) +
+                self._col_match * (by_column + reused_by_column * self._reuse_match))
+
+    @property
+    def row_count(self):
+        return self._row_count
+
+    @property
+    def num_count(self):
+        return self._num_count
+
+    @property
+    def multiplier(self):
+        return self._multiplier
+
+    @property
+    def build_count(self):
+        # builds since the last scramble
+        return self._build_count
+
+    @property
+    def builds_in_a_row(self):
+        # builds just made with no other operation since (0 when the last one wasn't a build)
+        return self._consecutive_builds + 1 if self._prev_cleanup == 'build' else 0
+
+    @property
+    def enable_build(self):
+        return self._enable_build
+
+    @property
+    def enable_scramble(self):
+        return self._enable_scramble
+
+    ### SNAPSHOTS ###
+
+    def snapshot(self):
+        # start (or continue) logging operations, restore(snapshot) undoes back to here
+        # and forget() stops logging once the outermost snapshot is done with
+        if self._undo is None:
+            self._undo = []
+        return len(self._undo)
+
+    def log_undo(self, calling_method):
+        if self._undo is not None:
+            # [operation, state, length of values, match index changes, values flipped]
+            self._undo.append([calling_method, [getattr(self, name) for name in UNDO_STATE], len(self.values), [], ()])
+
+    def restore(self, snapshot):
+        while len(self._undo) > snapshot:
+            self.undo()
+
+    def forget(self):
+        self._undo = None
+
+    def undo(self):
+        _, state, length, changes, flipped = self._undo.pop()
+        tracked = self._cells is not None
+        self._hints = None
+        for func, *func_args in reversed(changes):
+            func(*func_args)
+        for name, value in zip(UNDO_STATE, state):
+            setattr(self, name, value)
+        self.values = self._grid.truncate(self.values, length)
+        for index in flipped:
+            self.values[index] *= -1
+            self._row_live[index // self._max_width] += 1
+        if tracked and self._cells is None:
+            # reuse tracking started after this operation, it carries on from here
+            self.tally_matches()
+
+    def clone(self):
+        # independent copy sharing the configuration, without the undo log and
+        # with its own copy of the rng (unless it's the random module's global state)
+        twin = copy(self)
+        twin.unshare()
+        return twin
+
+    def unshare(self):
+        self.values = self._grid.new(self.values)
+        self._matches = list(self._matches)
+        self._match_keys = list(self._match_keys)
+        self._cells = None if self._cells is None else dict(self._cells)
+        self._row_pairs = dict(self._row_pairs)
+        self._col_pairs = dict(self._col_pairs)
+        self._row_live = list(self._row_live)
+        self._hints = None
+        self._undo = None
+        if not isinstance(self._rng, GlobalRandom):
+            self._rng = copy(self._rng)
+
     ### INDEX CONVERSION ###
 
     def index_from_col_row(self, col, row):
         return (row - 1) * self._max_width + (col - 1)
 
     def col_row_from_index(self, index):
-        col = (index + 1) - (self._max_width * ((index + 1) // self._max_width))
-        row = ((index + 1) // self._max_width) + 1
+        col = (index % self._max_width) + 1
+        row = (index // self._max_width) + 1
         return (col, row)
 
     def col_row_from_col_row_num(self, col_num, row_num):
@@ -309,11 +623,13 @@ class Puzzle:
 
     ### SEARCH ITERATION BUILDERS ###
 
+    @profiled
     def build_rows(self, values=None):
         if values is None:
             values = self.values
         return [values[col: col + self._max_width] for col in range(0, len(values), self._max_width)]
 
+    @profiled
     def build_columns(self):
         rows = [self.values[col: col + self._max_width] for col in range(0, len(self.values), self._max_width)]
         cols = []
@@ -340,139 +656,85 @@ class Puzzle:
         return None
 
     def find_match(self):
-        return choice(self._matches)
+        # a random match as (index, index)
+        return self._rng.choice(self._matches)
 
+    @profiled
     def find_all(self):
-        self._matches = []
-        self._grid_value = 0
-        self._grid_matches = 0
-        _used = []
-
-        # by index (_row_match)
-        for index, val in enumerate(self.values[:-1]):
-            if val > 0:
-                if index == 0:
-                    if self.values[-1] > 0 and self.is_match(val, self.values[-1]):
-                        m1 = self.col_row_from_index(index)
-                        m2 = self.col_row_from_index(len(self.values) - 1)
-                        self._matches.append((m1, m2))
-                        self._grid_matches += 1
-                        if (m1 in _used) or (m2 in _used):
-                            if not m1 in _used:
-                                _used.append(m1)
-                            if not m2 in _used:
-                                _used.append(m2)
-                            self._grid_value += self._row_match * self._reuse_match
-                        else:
-                            _used.append(m1)
-                            _used.append(m2)
-                            self._grid_value += self._row_match
-                for _index, _val in enumerate(self.values[index + 1:]):
-                    if _val > 0:
-                        if self.is_match(val, _val):
-                            m1 = self.col_row_from_index(index)
-                            m2 = self.col_row_from_index(_index + index + 1)
-                            self._matches.append((m1, m2))
-                            self._grid_matches += 1
-                            if (m1 in _used) or (m2 in _used):
-                                if not m1 in _used:
-                                    _used.append(m1)
-                                if not m2 in _used:
-                                    _used.append(m2)
-                                self._grid_value += self._row_match * self._reuse_match
-                            else:
-                                _used.append(m1)
-                                _used.append(m2)
-                                self._grid_value += self._row_match
-                        break
-        # by column (_col_match)
-        for col_num, col in enumerate(self.build_columns()):
-            for row_num, val in enumerate(col[:-1]):
-                if val > 0:
-                    for _row_num, _val in enumerate(col[row_num + 1:]):
-                        if _val > 0:
-                            if self.is_match(val, _val):
-                                m1 = self.col_row_from_col_row_num(col_num, row_num)
-                                m2 = self.col_row_from_col_row_num(col_num, _row_num + row_num + 1)
-                                self._matches.append((m1, m2))
-                                self._grid_matches += 1
-                                if (m1 in _used) or (m2 in _used):
-                                    if not m1 in _used:
-                                        _used.append(m1)
-                                    if not m2 in _used:
-                                        _used.append(m2)
-                                    self._grid_value += self._col_match * self._reuse_match
-                                else:
-                                    _used.append(m1)
-                                    _used.append(m2)
-                                    self._grid_value += self._col_match
-                            break
+        # full rescan, rebuilding the match index from scratch
+        self._row_pairs, self._col_pairs = self._grid.find_pairs(self.values, self._max_width, self._sum_value)
+        self.collect_matches()
 
     ### AUTOMATED TESTING ###
 
-    def solve(self, fully_solve=True):
-        start = datetime.now()
-        out_fmt = 'STEP {0:>6} | {1:^8} | ROWS {2:>3} | NUMS {3:>4} | MATCHES {4:>5} | MULTIPLIER {5} | SCORE {6:>7} '
-        solve_fmt = '### SOLVE\n'
-        solve_fmt += '  TOTAL STEPS:       {0:>6}\n'
-        solve_fmt += '  HIGHEST ROW COUNT: {1:>6}\n'
-        solve_fmt += '  TOTAL MATCHES:     {2:>6}\n'
-        solve_fmt += '  TOTAL BUILDS:      {3:>6}\n'
-        solve_fmt += '  TOTAL SCRAMBLES:   {4:>6}\n'
-        solve_fmt += '  SCORE:             {5:>6}\n'
-        solve_fmt += '  MULTIPLIERS:'
-        self.display()
+    def play(self, fully_solve=True, on_step=None, selector=None, endgame=None, max_steps=None, time_budget=None, max_repeats=None): # pylint: disable=too-many-arguments,too-many-positional-arguments
+        # plays without any console output of its own (unless debug < 0), on_step is
+        # called as on_step(puzzle, step, action, move) after every MATCH, BUILD and SCRAMBLE
+        # and selector(puzzle) picks each match in place of find_match. matches (the move
+        # given to on_step and what selector returns) are (index, index). with an endgame
+        # table (see numzilla_endgame) the table picks every match once num_count is down to its k
+        # max_steps, time_budget (seconds) and max_repeats stop a game that runs on as unterminated. a
+        # scramble dealing the same multiset of live values as the start or an earlier scramble is a repeat,
+        # spotted by a hash of the live values (a match takes their two keys off, a build doubles it). that is
+        # a heuristic: the arrangement and multiplier are left out, so a repeat is not the same grid dealt again
+        # ctrl+c stops the game too, returning what it got to as interrupted
+        if endgame is not None:
+            endgame.check(self)
+        start = perf_counter()
+        deadline = None if time_budget is None else start + time_budget
+        limit = None
+        state = sum(STATE_KEYS[val] for val in self.values if val > 0) & STATE_MASK
+        seen = {state: 1}
+        repeats = 0
+        def over_budget():
+            if max_steps is not None and step >= max_steps:
+                return 'steps'
+            return 'time' if deadline is not None and perf_counter() >= deadline else None
         max_rows = 0
         matches = 0
         builds = 0
         scrambles = 0
-        multis = {1: 1,
-                  2: 0,
-                  3: 0,
-                  4: 0,
-                  5: 0,
-                  6: 0,
-                  7: 0,
-                  8: 0}
+        multis = dict.fromkeys(self._multiplier_population, 0)
+        multis[self._multiplier] = multis.get(self._multiplier, 0) + 1
         step = 0
         cont1 = True
         skip_first_scramble = True
+        interrupted = False
         try:
             while cont1:
                 max_rows = self._row_count if self._row_count > max_rows else max_rows
                 if skip_first_scramble:
                     skip_first_scramble = False
                 else:
+                    limit = over_budget()
+                    if limit is not None:
+                        break
                     step += 1
                     scrambles += 1
                     self.scramble()
-                    if self.debug < 0:
-                        output(out_fmt.format(
-                                step,
-                                'SCRAMBLE',
-                                self._row_count,
-                                self._num_count,
-                                self._grid_matches,
-                                self._multiplier,
-                                self.score))
                     multis[self._multiplier] += 1
-                cont2 = True
+                    self.step_done(step, 'SCRAMBLE', None, on_step)
+                    seen[state] = seen.get(state, 0) + 1
+                    if seen[state] > 1:
+                        repeats += 1
+                        if max_repeats is not None and repeats > max_repeats:
+                            limit = 'multiset_repeats'
+                cont2 = limit is None
                 while cont2:
+                    limit = over_budget()
+                    if limit is not None:
+                        break
                     step += 1
                     max_rows = self._row_count if self._row_count > max_rows else max_rows
                     if self._grid_matches > 0:
                         matches += 1
-                        m1, m2 = self.find_match()
-                        self.match(m1, m2)
-                        if self.debug < 0:
-                            output(out_fmt.format(
-                                step,
-                                'MATCH',
-                                self._row_count,
-                                self._num_count,
-                                self._grid_matches,
-                                self._multiplier,
-                                self.score))
+                        move = None if endgame is None else endgame.move(self)
+                        if move is None:
+                            move = self.find_match() if selector is None else selector(self)
+                        i1, i2 = move
+                        state = (state - STATE_KEYS[self.values[i1]] - STATE_KEYS[self.values[i2]]) & STATE_MASK
+                        self.match_index(i1, i2)
+                        self.step_done(step, 'MATCH', (i1, i2), on_step)
                     elif len(self.values) == 0:
                         cont2 = False
                     elif self._enable_scramble:
@@ -480,27 +742,68 @@ class Puzzle:
                     else:
                         builds += 1
                         self.build()
-                        if self.debug < 0:
-                            output(out_fmt.format(
-                                step,
-                                'BUILD',
-                                self._row_count,
-                                self._num_count,
-                                self._grid_matches,
-                                self._multiplier,
-                                self.score))
+                        state = (state * 2) & STATE_MASK
+                        self.step_done(step, 'BUILD', None, on_step)
                 if len(self.values) == 0:
                     cont1 = False
-                if not fully_solve:
+                if not fully_solve or limit is not None:
                     cont1 = False
-            output(solve_fmt.format(step, max_rows, matches, builds, scrambles, self.score))
-            for i in range(1, 9):
-                output('  {0} : {1}'.format(i, multis[i] * '*'))
         except KeyboardInterrupt:
+            # ctrl+c ends the game where it got to, possibly in the middle of an operation
+            interrupted = True
+        if interrupted:
+            status = 'interrupted'
+        else:
+            status = 'finished' if len(self.values) == 0 else 'partial' if limit is None else 'unterminated'
+        return GameResult(step, max_rows, matches, builds, scrambles, self.score, multis, perf_counter() - start, status, limit, repeats)
+
+    def step_done(self, step, action, move, on_step):
+        if self.debug < 0:
+            out_fmt = 'STEP {0:>6} | {1:^8} | ROWS {2:>3} | NUMS {3:>4} | MATCHES {4:>5} | MULTIPLIER {5} | SCORE {6:>7} '
+            output(out_fmt.format(
+                step,
+                action,
+                self._row_count,
+                self._num_count,
+                self._grid_matches,
+                self._multiplier,
+                self.score))
+        if on_step is not None:
+            on_step(self, step, action, move)
+
+    def solve(self, fully_solve=True, silent=False, on_step=None, selector=None, endgame=None, max_steps=None, time_budget=None, max_repeats=None): # pylint: disable=too-many-arguments,too-many-positional-arguments
+        if silent:
+            # no display, no summary and no debug output, just the GameResult
+            debug = self.debug
+            self.debug = 0
+            try:
+                return self.play(fully_solve, on_step, selector, endgame, max_steps, time_budget, max_repeats)
+            finally:
+                self.debug = debug
+
+        start = datetime.now()
+        solve_fmt = '### SOLVE\n'
+        solve_fmt += '  TOTAL STEPS:       {0:>6}\n'
+        solve_fmt += '  HIGHEST ROW COUNT: {1:>6}\n'
+        solve_fmt += '  TOTAL MATCHES:     {2:>6}\n'
+        solve_fmt += '  TOTAL BUILDS:      {3:>6}\n'
+        solve_fmt += '  TOTAL SCRAMBLES:   {4:>6}\n'
+        solve_fmt += '  SCORE:             {5:>6}\n'
+        solve_fmt += '  MULTIPLIERS:'
+        self.display()
+        result = self.play(fully_solve, on_step, selector, endgame, max_steps, time_budget, max_repeats)
+        if result.status == 'interrupted':
             self.display()
+        output(solve_fmt.format(*result[:6]))
+        for i in sorted(result.multipliers):
+            output('  {0} : {1}'.format(i, result.multipliers[i] * '*'))
+        if result.status == 'unterminated':
+            output('### UNTERMINATED: {0} LIMIT | {1} NUMS LEFT | {2} REPEATS'.format(result.limit.upper(), self._num_count, result.repeats))
+        elif result.status == 'interrupted':
+            output('### INTERRUPTED AT STEP {0} | {1} NUMS LEFT'.format(result.steps, self._num_count))
         end = (datetime.now() - start).total_seconds()
         output('TOTAL RUNTIME: {0}'.format(end))
-        return scrambles
+        return result.scrambles
 
     ### DEBUG PRINTS ###
 
@@ -513,6 +816,11 @@ class Puzzle:
         return used_fmt.format(value * -1)
 
     def display(self, values=None):
+        # the whole frame goes out in one output call
+        output('\n'.join(self.frame(values)))
+
+    def frame(self, values=None):
+        # the lines display prints, without timestamps
         out = []
         if values is None:
             values = self.values
@@ -535,26 +843,25 @@ class Puzzle:
         inner_sep = '-' * (self._max_width * 3 + (self._max_width - 1))
         outer_sep = '=' * (self._max_width * 3 + (self._max_width - 1))
 
-        output(outer_sep)
-        output(' ' * score_offset + score_text)
-        output(' ' * multi_offset + multi_text)
-        output('\n'.join([' '.join(row) for row in out]))
-        output(inner_sep)
-        output('  GRID MATCHES:   {0}'.format(self._grid_matches))
-        output('  GRID VALUE:     {0:.2f}'.format(self._grid_value))
-        output('  ROW COUNT:      {0}'.format(self._row_count))
-        output('  BUILD COUNT:    {0}'.format(self._build_count))
-        output(inner_sep)
+        lines = [outer_sep, ' ' * score_offset + score_text, ' ' * multi_offset + multi_text]
+        lines.extend(' '.join(row) for row in out)
+        lines.append(inner_sep)
+        lines.append('  GRID MATCHES:   {0}'.format(self._grid_matches))
+        lines.append('  GRID VALUE:     {0:.2f}'.format(self.grid_value))
+        lines.append('  ROW COUNT:      {0}'.format(self._row_count))
+        lines.append('  BUILD COUNT:    {0}'.format(self._build_count))
+        lines.append(inner_sep)
 
         if self._enable_build:
-            output(' +BUILD ENABLED')
+            lines.append(' +BUILD ENABLED')
         else:
-            output('  BUILD DISABLED')
+            lines.append('  BUILD DISABLED')
         if self._enable_scramble:
-            output(' *SCRAMBLE ENABLED')
+            lines.append(' *SCRAMBLE ENABLED')
         else:
-            output('  SCRAMBLE DISABLED')
-        output(outer_sep)
+            lines.append('  SCRAMBLE DISABLED')
+        lines.append(outer_sep)
+        return lines
 
 
 def unit_test():
@@ -577,8 +884,8 @@ def unit_test():
 
     output('????? attempt match')
     _ = input('(press enter to continue)')
-    m1, m2 = _p.find_match()
-    _p.match(m1, m2)
+    i1, i2 = _p.find_match()
+    _p.match_index(i1, i2)
 
     output('????? build new rows')
     _ = input('(press enter to continue)')
@@ -0,0 +1,187 @@
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import repeat
+from json import dump, load
+from random import Random
+from collections import Counter
+from statistics import mean, median
+
+from numzilla import GameResult, Puzzle, output
+
+### BATCH SIMULATION ###
+#  plays independent games across a process pool. every game is seeded from
+#  its own number (seed + game), so results don't depend on the worker count
+#  or on which worker picked the game up.
+#
+#  limits are Puzzle.play's budgets ({'max_steps': 20000, 'time_budget': 5,
+#  'max_repeats': 3}, any of them), so a game that runs on stops as unterminated
+#  instead of holding its worker up.
+
+def play_games(seeds, puzzle_kwargs, limits=None):
+    results = []
+    for seed in seeds:
+        result = Puzzle(rng=Random(seed), **puzzle_kwargs).play(**(limits or {}))
+        if result.status == 'interrupted':
+            # a game cut short by ctrl+c never makes it into a batch or a shard
+            raise KeyboardInterrupt
+        results.append(result)
+    return results
+
+def map_chunks(play, games, workers=None, seed=0, chunk_size=None, play_args=()): # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # what play(seeds, *play_args) returns for every chunk of the seeds seed to seed + games,
+    # in seed order, played across a process pool (in this process with one worker)
+    workers = workers or os.cpu_count() or 1
+    seeds = range(seed, seed + games)
+    if workers == 1:
+        yield play(seeds, *play_args)
+        return
+
+    # a few chunks per worker keeps the pool balanced without paying ipc per game
+    if chunk_size is None:
+        chunk_size = max(1, games // (workers * 4))
+    chunks = [seeds[i: i + chunk_size] for i in range(0, games, chunk_size)]
+    with ProcessPoolExecutor(workers) as pool:
+        yield from pool.map(play, chunks, *(repeat(arg) for arg in play_args))
+
+def run_batch(games, workers=None, seed=0, chunk_size=None, limits=None, **puzzle_kwargs):
+    puzzle_kwargs.setdefault('debug', 0)
+    results = []
+    for chunk in map_chunks(play_games, games, workers, seed, chunk_size, (puzzle_kwargs, limits)):
+        results += chunk
+    return results
+
+def summary(results):
+    out = ['### BATCH: {0} GAMES'.format(len(results))]
+    for field in ('steps', 'max_rows', 'matches', 'builds', 'scrambles', 'score'):
+        values = [getattr(result, field) for result in results]
+        out.append('  {0:<10} MEAN {1:>10.2f} | MEDIAN {2:>8} | MIN {3:>8} | MAX {4:>8}'.format(
+            field.upper(), mean(values), median(values), min(values), max(values)))
+    limits = Counter(result.limit for result in results if result.status == 'unterminated')
+    if limits:
+        out.append('  UNTERMINATED {0} | {1}'.format(sum(limits.values()), ' | '.join(
+            '{0} {1}'.format(limit.upper(), count) for limit, count in sorted(limits.items()))))
+    return '\n'.join(out)
+
+
+### CAMPAIGNS ###
+#  a campaign is a long batch split into shards of shard_size consecutive seeds.
+#  every finished shard is written to its own file in the campaign directory,
+#  so an interrupted run picks up where it stopped, and several nodes can share
+#  the directory (or have their files copied together later) with node / nodes
+#  handing each one every nodes-th shard. merge_campaign reads the shards back
+#  in seed order, so the merged results never depend on who played what.
+
+CAMPAIGN_FILE = 'campaign.json'
+SHARD_FILE = 'shard-{0:06d}.json'
+
+def write_json(path, data):
+    # write then rename, an interrupted run never leaves half a file behind
+    temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temp, 'w', encoding='utf-8') as out:
+        dump(data, out)
+    os.replace(temp, path)
+
+def read_json(path):
+    with open(path, encoding='utf-8') as src:
+        return load(src)
+
+def load_result(fields):
+    # a GameResult saved as a json list, whose multiplier keys came back as strings
+    fields[6] = {int(multiplier): count for multiplier, count in fields[6].items()}
+    return GameResult(*fields)
+
+def shard_path(directory, shard):
+    return os.path.join(directory, SHARD_FILE.format(shard))
+
+def shard_count(campaign):
+    return -(-campaign['games'] // campaign['shard_size'])
+
+def shard_seeds(campaign, shard):
+    start = campaign['seed'] + shard * campaign['shard_size']
+    return range(start, min(start + campaign['shard_size'], campaign['seed'] + campaign['games']))
+
+def play_shard(campaign, shard):
+    return shard, play_games(shard_seeds(campaign, shard), campaign['puzzle_kwargs'], campaign.get('limits'))
+
+def open_campaign(directory, games, shard_size, seed, puzzle_kwargs, limits=None): # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # resuming only makes sense with the exact same parameters
+    campaign = {'games': games, 'shard_size': shard_size, 'seed': seed, 'puzzle_kwargs': puzzle_kwargs}
+    if limits:
+        campaign['limits'] = limits
+    path = os.path.join(directory, CAMPAIGN_FILE)
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(path):
+        if read_json(path) != campaign:
+            raise ValueError('{0} holds a different campaign'.format(directory))
+    else:
+        write_json(path, campaign)
+    return campaign
+
+def run_campaign(directory, games, shard_size=1000, seed=0, workers=None, node=0, nodes=1, limits=None, **puzzle_kwargs): # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # plays this node's unfinished shards, returns the number of shards played
+    workers = workers or os.cpu_count() or 1
+    puzzle_kwargs.setdefault('debug', 0)
+    campaign = open_campaign(directory, games, shard_size, seed, puzzle_kwargs, limits)
+    pending = [shard for shard in range(node, shard_count(campaign), nodes) if not os.path.exists(shard_path(directory, shard))]
+    if workers == 1:
+        for shard in pending:
+            save_shard(directory, *play_shard(campaign, shard))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            for future in as_completed([pool.submit(play_shard, campaign, shard) for shard in pending]):
+                save_shard(directory, *future.result())
+    return len(pending)
+
+def save_shard(directory, shard, results):
+    write_json(shard_path(directory, shard), [list(result) for result in results])
+
+def campaign_progress(directory):
+    # (finished shards, total shards)
+    campaign = read_json(os.path.join(directory, CAMPAIGN_FILE))
+    shards = shard_count(campaign)
+    return len([shard for shard in range(shards) if os.path.exists(shard_path(directory, shard))]), shards
+
+def merge_campaign(directory):
+    campaign = read_json(os.path.join(directory, CAMPAIGN_FILE))
+    results = []
+    for shard in range(shard_count(campaign)):
+        path = shard_path(directory, shard)
+        if not os.path.exists(path):
+            raise ValueError('shard {0} of {1} is missing'.format(shard, directory))
+        results += [load_result(fields) for fields in read_json(path)]
+    return results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='play independent numzilla games across a process pool')
+    parser.add_argument('games', type=int)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-width', type=int, default=None)
+    parser.add_argument('--num-start-rows', type=int, default=None)
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--campaign', default=None, help='directory to checkpoint shards to, resuming any already there')
+    parser.add_argument('--shard-size', type=int, default=1000)
+    parser.add_argument('--node', type=int, default=0)
+    parser.add_argument('--nodes', type=int, default=1)
+    parser.add_argument('--max-steps', type=int, default=None, help='steps before a game is stopped as unterminated')
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds before a game is stopped as unterminated')
+    parser.add_argument('--max-repeats', type=int, default=None, help='scrambles dealing an earlier multiset of live values before a game is stopped')
+    args = parser.parse_args()
+
+    kwargs = {key: val for key, val in (('max_width', args.max_width),
+                                        ('num_start_rows', args.num_start_rows),
+                                        ('backend', args.backend)) if val is not None}
+    play_limits = {key: val for key, val in (('max_steps', args.max_steps),
+                                             ('time_budget', args.time_budget),
+                                             ('max_repeats', args.max_repeats)) if val is not None}
+    if args.campaign is None:
+        output(summary(run_batch(args.games, args.workers, args.seed, limits=play_limits, **kwargs)))
+    else:
+        played = run_campaign(args.campaign, args.games, args.shard_size, args.seed, args.workers, args.node, args.nodes,
+                              play_limits, **kwargs)
+        done, total = campaign_progress(args.campaign)
+        output('### CAMPAIGN: {0} SHARDS PLAYED | {1} OF {2} DONE'.format(played, done, total))
+        if done == total:
+            output(summary(merge_campaign(args.campaign)))
@@ -0,0 +1,149 @@
+import platform
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dump, load
+from random import Random
+from time import perf_counter
+
+from numzilla import Defaults, Puzzle, output
+
+### BENCHMARKS ###
+#  times the core operations on seeded boards (the same board for a given
+#  seed, width and row count on every run) and saves the results as json so
+#  two runs can be compared. each operation runs on a fresh clone of the board,
+#  and only the operation itself is timed. ops/sec is taken from the fastest of
+#  several rounds, the figure least disturbed by whatever else the machine is
+#  doing. memory is the peak traced allocation of one call.
+
+OPERATIONS = ('find_all', 'match', 'row_removal', 'build', 'scramble', 'solve')
+ROWS = (6, 50, 200, 500)
+WIDTHS = (Defaults.max_width, 20)
+ROUNDS = 5
+SOLVE_ROWS = 50 # full games on bigger or wider boards take minutes, solve is skipped on those
+
+def board(width, rows, seed, backend):
+    return Puzzle(debug=0, max_width=width, num_start_rows=rows, backend=backend, rng=Random(seed))
+
+def clear_first_row(puzzle):
+    for index in range(len(puzzle.build_rows()[0])):
+        puzzle.values[index] = -abs(puzzle.values[index])
+    puzzle.recount()
+    return puzzle
+
+# operation -> (setup(board) giving the state to run on, operation(state))
+BENCHES = {
+    'find_all': (lambda puzzle: puzzle, lambda puzzle: puzzle.find_all()),
+    'match': (lambda puzzle: puzzle.clone(), lambda puzzle: puzzle.match_index(*puzzle.index_matches[0])),
+    'row_removal': (lambda puzzle: clear_first_row(puzzle.clone()), lambda puzzle: puzzle.row_removal((0,))),
+    'build': (lambda puzzle: puzzle.clone(), lambda puzzle: puzzle.build()),
+    'scramble': (lambda puzzle: puzzle.clone(), lambda puzzle: puzzle.scramble()),
+    'solve': (lambda puzzle: puzzle.clone(), lambda puzzle: puzzle.solve(silent=True))
+}
+
+def measure(setup, operation, min_time):
+    # (total calls, total seconds, best ops/sec of any round, peak bytes of one call)
+    calls = 0
+    elapsed = 0.0
+    best = 0.0
+    for _ in range(ROUNDS):
+        round_calls = 0
+        round_time = 0.0
+        while round_time < min_time / ROUNDS or round_calls == 0:
+            state = setup()
+            start = perf_counter()
+            operation(state)
+            round_time += perf_counter() - start
+            round_calls += 1
+        calls += round_calls
+        elapsed += round_time
+        best = max(best, round_calls / round_time)
+
+    state = setup()
+    tracemalloc.start()
+    operation(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return calls, elapsed, best, peak
+
+def run(operations=OPERATIONS, widths=WIDTHS, rows=ROWS, backend=Defaults.backend, seed=0, min_time=0.5): # pylint: disable=too-many-arguments,too-many-positional-arguments
+    results = []
+    for width in widths:
+        for num_rows in rows:
+            puzzle = board(width, num_rows, seed, backend)
+            for name in operations:
+                if name == 'solve' and (num_rows > SOLVE_ROWS or width > Defaults.max_width):
+                    continue
+                setup, operation = BENCHES[name]
+                calls, elapsed, ops_per_sec, peak = measure(lambda puzzle=puzzle, setup=setup: setup(puzzle), operation, min_time)
+                results.append({'op': name, 'width': width, 'rows': num_rows, 'backend': backend, 'calls': calls,
+                                'seconds': elapsed, 'ops_per_sec': ops_per_sec, 'peak_kb': peak / 1024})
+    return {'meta': {'date': datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+                     'platform': platform.platform(), 'seed': seed, 'min_time': min_time},
+            'results': results}
+
+def result_key(result):
+    return (result['op'], result['width'], result['rows'], result['backend'])
+
+def compare(old, new, threshold=0.2):
+    # (report lines, regressions) for every benchmark found in both runs, a
+    # regression is ops/sec dropping by more than threshold (a fraction)
+    old_results = {result_key(result): result for result in old['results']}
+    out = []
+    regressions = 0
+    for result in new['results']:
+        before = old_results.get(result_key(result))
+        if before is None:
+            continue
+        change = result['ops_per_sec'] / before['ops_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = ' << REGRESSION'
+            regressions += 1
+        out.append('  {0:<12} {1:>3} x {2:<4} {3:<6} {4:>12.1f} -> {5:>12.1f} OPS/S {6:>+8.1%} | {7:>10.1f} -> {8:>10.1f} KB{9}'.format(
+            *result_key(result), before['ops_per_sec'], result['ops_per_sec'], change, before['peak_kb'], result['peak_kb'], flag))
+    return out, regressions
+
+def report(results):
+    out = ['### BENCHMARK: {0}'.format(results['meta']['date'])]
+    for result in results['results']:
+        out.append('  {0:<12} {1:>3} x {2:<4} {3:<6} {4:>12.1f} OPS/S | {5:>10.1f} KB'.format(
+            *result_key(result), result['ops_per_sec'], result['peak_kb']))
+    return '\n'.join(out)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='benchmark the core numzilla operations, or compare two benchmark runs')
+    commands = parser.add_subparsers(dest='command', required=True)
+    bench = commands.add_parser('run', help='run the benchmarks')
+    bench.add_argument('--out', default=None, help='json file to save the results to')
+    bench.add_argument('--ops', default=','.join(OPERATIONS))
+    bench.add_argument('--widths', default=','.join(str(width) for width in WIDTHS))
+    bench.add_argument('--rows', default=','.join(str(num_rows) for num_rows in ROWS))
+    bench.add_argument('--backend', default=Defaults.backend)
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--time', type=float, default=0.5, help='minimum seconds timed per benchmark')
+    versus = commands.add_parser('compare', help='compare two saved runs, exits 1 on a regression')
+    versus.add_argument('old')
+    versus.add_argument('new')
+    versus.add_argument('--threshold', type=float, default=0.2, help='fractional drop in ops/sec counted as a regression')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        bench_run = run(args.ops.split(','), [int(width) for width in args.widths.split(',')],
+                        [int(num_rows) for num_rows in args.rows.split(',')], args.backend, args.seed, args.time)
+        output(report(bench_run))
+        if args.out is not None:
+            with open(args.out, 'w', encoding='utf-8') as dst:
+                dump(bench_run, dst, indent=1)
+    else:
+        with open(args.old, encoding='utf-8') as src:
+            old_run = load(src)
+        with open(args.new, encoding='utf-8') as src:
+            new_run = load(src)
+        report_lines, regressed = compare(old_run, new_run, args.threshold)
+        output('\n'.join(['### COMPARE: {0} -> {1}'.format(old_run['meta']['date'], new_run['meta']['date'])] + report_lines))
+        if regressed:
+            output('### {0} REGRESSION(S)'.format(regressed))
+            sys.exit(1)
@@ -0,0 +1,255 @@
+import os
+import sys
+from argparse import ArgumentParser
+from random import Random
+from tempfile import TemporaryDirectory
+
+from numzilla import GRID_BACKENDS, Puzzle, output
+from numzilla_batch import summary
+from numzilla_endgame import EndgameTable, Generator, grid_cells, encode
+from numzilla_grid import ListGrid
+from numzilla_search import candidates, rolled_back
+from numzilla_trace import TraceReader, TraceWriter
+
+try:
+    from numzilla_lockstep import Lockstep
+except ImportError: # numpy is optional, only needed for the lockstep check
+    Lockstep = None
+
+### CONSISTENCY CHECKS ###
+#  plays seeded games and checks what Puzzle keeps up to date as it goes
+#  against what it finds from scratch, so a change to the incremental match
+#  index, hint buckets or a grid backend that drifts from the full scan shows
+#  up as a mismatch instead of as odd scores much later:
+#
+#  index:    after every move, the match index, grid_value and hints against a
+#            clone that rebuilds them with find_all. every undo_every moves a
+#            match and a build are played and undone, and must leave the grid,
+#            index and hints as they were
+#  backends: every backend plays each seed move for move to the same result
+#            as the list one
+#  grids:    random grids (widths 1 to 13, sum values 3 to 12, used values and
+#            scans starting part way in) scanned by every backend as ListGrid
+#            scans them
+#  endgame:  a generated table against a brute force search over match_index
+#            in every state of the games with k live values or fewer: the
+#            table move must be a match, and its stored leftover and score
+#            must equal both the best line and the line starting with the move
+#  lockstep: after every tick of a Lockstep batch, the links and pairs of
+#            every game against a scan from scratch (with numpy only)
+#  trace:    the games are written to a trace, summarised from its headers and
+#            replayed to the scores they recorded
+#
+#  board widths and row counts cycle with the seed. the script lists every
+#  mismatch after the checks and exits 1 when there was any
+
+WIDTHS = (3, 5, 7, 10)
+MAX_ROWS = 5
+ENDGAME_K = 4
+
+def board(seed, backend):
+    return Puzzle(debug=0, max_width=WIDTHS[seed % len(WIDTHS)], num_start_rows=1 + seed % MAX_ROWS,
+                  backend=backend, rng=Random(seed))
+
+def index_state(puzzle):
+    # everything the match index answers, hints ranked over every match
+    return (list(puzzle.values), list(puzzle.index_matches), puzzle.grid_matches, puzzle.grid_value,
+            puzzle.hints(puzzle.grid_matches))
+
+def rescanned(puzzle):
+    fresh = puzzle.clone()
+    fresh.find_all()
+    return index_state(fresh)
+
+def played(seed, backend, max_steps):
+    # the GameResult of a game, without its runtime, and its moves step by step
+    moves = []
+    result = board(seed, backend).play(on_step=lambda puzzle, _step, action, move: moves.append((action, move, puzzle.score)),
+                                       max_steps=max_steps)
+    return result._replace(runtime=None), moves
+
+def random_grid(rng):
+    # (values, max_width, sum_value, start) of a random grid, used values and all
+    max_width = rng.randint(1, 13)
+    values = [rng.choice((-1, 1, 1)) * rng.randint(1, 9) for _ in range(rng.randint(0, 8 * max_width))]
+    return values, max_width, rng.randint(3, 12), rng.randint(0, len(values))
+
+def scanned(grid, values, max_width, sum_value, start):
+    # everything a backend scans on values, as lists
+    stored = grid.new(values)
+    rows = list(range(0, -(-len(values) // max_width), 2)) # every other row
+    return (grid.find_pairs(stored, max_width, sum_value, start), grid.find_pairs(stored, max_width, sum_value),
+            grid.has_pairs(stored, max_width, sum_value), list(grid.row_counts(stored, max_width)),
+            [int(val) for val in grid.live(stored)], grid.live_count(stored),
+            [int(val) for val in grid.remove_rows(stored, rows, max_width)])
+
+def best_line(puzzle):
+    # (live values left, score at multiplier 1) of the best line of matches, ranked as
+    # numzilla_endgame.Generator ranks them: fewest values left, then highest score
+    best = (puzzle.num_count, 0.0)
+    mark = puzzle.snapshot()
+    for i1, i2 in candidates(puzzle):
+        score = puzzle.score
+        puzzle.match_index(i1, i2)
+        gained = (puzzle.score - score) / puzzle.multiplier
+        left, line = best_line(puzzle)
+        puzzle.restore(mark)
+        if (left, -(gained + line)) < (best[0], -best[1]):
+            best = (left, gained + line)
+    return best
+
+def same_line(line, left, score):
+    return line[0] == left and abs(line[1] - score) < 1e-9
+
+
+def check_index(seeds, backends, max_steps, undo_every=7):
+    # [mismatch, ...] of the incremental index against a rescan, and of undo
+    mismatches = []
+    for backend in backends:
+        for seed in seeds:
+            def on_step(puzzle, step, action, _move, backend=backend, seed=seed):
+                current = index_state(puzzle)
+                if current != rescanned(puzzle):
+                    mismatches.append('INDEX {0} SEED {1} STEP {2} {3}'.format(backend, seed, step, action))
+                if step % undo_every == 0:
+                    mark = puzzle.snapshot()
+                    if puzzle.grid_matches:
+                        puzzle.match_index(*puzzle.find_match())
+                    puzzle.build()
+                    puzzle.restore(mark)
+                    puzzle.forget()
+                    if index_state(puzzle) != current:
+                        mismatches.append('UNDO {0} SEED {1} STEP {2}'.format(backend, seed, step))
+            board(seed, backend).play(on_step=on_step, max_steps=max_steps)
+    return mismatches
+
+def check_backends(seeds, backends, max_steps):
+    # [mismatch, ...] of every backend's games against the list backend's, step by step
+    mismatches = []
+    for seed in seeds:
+        expected = played(seed, 'list', max_steps)
+        for backend in backends:
+            if played(seed, backend, max_steps) != expected:
+                mismatches.append('RESULT {0} SEED {1}'.format(backend, seed))
+    return mismatches
+
+def check_grids(grids, backends, seed):
+    # [mismatch, ...] of every backend's scans of random grids against ListGrid's
+    mismatches = []
+    rng = Random(seed)
+    for number in range(grids):
+        grid_args = random_grid(rng)
+        expected = scanned(ListGrid, *grid_args)
+        for backend in backends:
+            if scanned(GRID_BACKENDS[backend], *grid_args) != expected:
+                mismatches.append('GRID {0} NUMBER {1}'.format(backend, number))
+    return mismatches
+
+def check_endgame(seeds, directory):
+    # ([mismatch, ...], states checked) of an endgame table against a brute force search
+    mismatches = []
+    states = []
+    path = os.path.join(directory, 'check.nze')
+    Generator(ENDGAME_K).run().write(path)
+    with EndgameTable(path) as endgame:
+        for seed in seeds:
+            def on_step(puzzle, step, _action, _move, seed=seed):
+                if puzzle.num_count > endgame.k or puzzle.grid_matches == 0:
+                    return
+                states.append(seed)
+                record = endgame.lookup(encode(grid_cells(puzzle.values, puzzle.max_width)[1], lambda val: endgame.sum_value - val))
+                move = endgame.move(puzzle)
+                with rolled_back(puzzle):
+                    if record is None or move not in candidates(puzzle) or not same_line(best_line(puzzle), *record[2:]):
+                        mismatches.append('ENDGAME SEED {0} STEP {1}'.format(seed, step))
+                        return
+                    score = puzzle.score
+                    puzzle.match_index(*move)
+                    left, line = best_line(puzzle)
+                    if not same_line((left, (puzzle.score - score) / puzzle.multiplier + line), *record[2:]):
+                        mismatches.append('ENDGAME MOVE SEED {0} STEP {1}'.format(seed, step))
+            board(seed, 'list').play(on_step=on_step)
+    return mismatches, len(states)
+
+def lockstep_mismatch(lockstep, width):
+    # the first lockstep array that differs from a scan from scratch, None when they all agree
+    games = len(lockstep.ids)
+    cols = lockstep.columns(lockstep.length)
+    row_next, row_prev, col_next, col_prev, pairs, wrap_pairs = lockstep.scan(lockstep.values[:, :cols], lockstep.length)
+    live = lockstep.values[:, :cols] > 0
+    for links, scanned_links in (('row_next', row_next), ('row_prev', row_prev), ('col_next', col_next), ('col_prev', col_prev)):
+        # links of used values and padding are never read
+        if (getattr(lockstep, links)[:, :cols][live] != scanned_links[live]).any():
+            return links
+    if (lockstep.wrap_pairs != wrap_pairs).any():
+        return 'wrap_pairs'
+    if (lockstep.pairs[:, :2 * cols] != pairs).any() or lockstep.pairs[:, 2 * cols:].any():
+        return 'pairs'
+    if (lockstep.pair_counts[:, :cols // width] != pairs.reshape((games, -1, 2 * width)).sum(axis=2)).any() or lockstep.pair_counts[:, cols // width:].any():
+        return 'pair_counts'
+    if (lockstep.pair_total != pairs.sum(axis=1)).any():
+        return 'pair_total'
+    return None
+
+def check_lockstep(seeds, max_ticks, games=20):
+    # [mismatch, ...] of Lockstep's incrementally kept links and pairs against a scan
+    mismatches = []
+    for seed in seeds:
+        width = WIDTHS[seed % len(WIDTHS)]
+        lockstep = Lockstep(games, width, 1 + seed % MAX_ROWS, seed)
+        while len(lockstep.results) < games and lockstep.ticks < max_ticks:
+            lockstep.step()
+            differs = lockstep_mismatch(lockstep, width)
+            if differs is not None:
+                mismatches.append('LOCKSTEP {0} SEED {1} TICK {2}'.format(differs, seed, lockstep.ticks))
+                break
+    return mismatches
+
+def check_trace(seeds, directory):
+    # [mismatch, ...] of games written to a trace against their summary and replay
+    mismatches = []
+    path = os.path.join(directory, 'check.nzt')
+    results = []
+    with TraceWriter(path) as writer:
+        for seed in seeds:
+            results.append(writer.record(seed, max_width=WIDTHS[seed % len(WIDTHS)], num_start_rows=1 + seed % MAX_ROWS))
+    with TraceReader(path) as reader:
+        headers = list(reader.headers())
+        if summary(headers) != summary(results):
+            mismatches.append('TRACE SUMMARY')
+        for game, header in enumerate(headers):
+            puzzle = reader.replay(game)
+            if puzzle.score != header.score or (len(puzzle.values) == 0) != (header.status == 'finished'):
+                mismatches.append('TRACE REPLAY SEED {0}'.format(header.seed))
+    return mismatches
+
+
+if __name__ == '__main__':
+    available = [backend for backend, grid in GRID_BACKENDS.items() if grid is not None]
+    parser = ArgumentParser(description='check the incrementally kept numzilla state against full rescans, exits 1 on a mismatch')
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-steps', type=int, default=2000, help='steps played per game in the index and backend checks')
+    parser.add_argument('--backends', default=','.join(available))
+    parser.add_argument('--grids', type=int, default=1000, help='random grids scanned by every backend')
+    parser.add_argument('--endgame-games', type=int, default=200, help='games whose endgame states are searched')
+    args = parser.parse_args()
+
+    check_seeds = range(args.seed, args.seed + args.games)
+    found = []
+    with TemporaryDirectory() as check_dir:
+        endgame_found, endgame_states = check_endgame(range(args.seed, args.seed + args.endgame_games), check_dir)
+        for name, checked, mismatched in (
+                ('INDEX', '{0} GAMES'.format(args.games), check_index(check_seeds, args.backends.split(','), args.max_steps)),
+                ('BACKENDS', '{0} GAMES'.format(args.games), check_backends(check_seeds, args.backends.split(','), args.max_steps)),
+                ('GRIDS', '{0} GRIDS'.format(args.grids), check_grids(args.grids, args.backends.split(','), args.seed)),
+                ('ENDGAME', '{0} STATES'.format(endgame_states), endgame_found),
+                ('LOCKSTEP', 'SKIPPED WITHOUT NUMPY' if Lockstep is None else '{0} BATCHES'.format(args.games),
+                 [] if Lockstep is None else check_lockstep(check_seeds, args.max_steps)),
+                ('TRACE', '{0} GAMES'.format(args.games), check_trace(check_seeds, check_dir))):
+            output('### CHECK {0}: {1} | {2} MISMATCHES'.format(name, checked, len(mismatched)))
+            found += mismatched
+    for mismatch in found:
+        output('  ' + mismatch)
+    if found:
+        sys.exit(1)
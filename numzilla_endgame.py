@@ -0,0 +1,291 @@
+from argparse import ArgumentParser
+from itertools import combinations, product
+from mmap import mmap, ACCESS_READ
+from random import Random
+from struct import Struct
+from time import perf_counter
+
+from numzilla import Defaults, Puzzle, output
+from numzilla_batch import summary
+
+### ENDGAME TABLES ###
+#  the best line of matches for every arrangement of up to k live values,
+#  generated once and memory-mapped by Puzzle.play(endgame=...) to finish a
+#  grid once num_count is down to k. a line is best when it leaves the fewest
+#  live values behind (0 clears the grid, anything else means another build),
+#  then by score.
+#
+#  matches only depend on the order of the live values, which of them share a
+#  column, their rows (for row removal and score) and whether the first one
+#  sits at index 0 and the last one at the last index (for the wrap around
+#  pair), so an arrangement is reduced to, per live value in index order:
+#  row and column (both numbered in order of first appearance, so widths and
+#  used cells drop out), whether it is in column 0, whether it ends its row,
+#  and its value as a token: values numbered in order of first appearance,
+#  a value's complement (sum_value - value) getting the token next to it.
+#  that makes 12 bits a value and a 64 bit key for up to MAX_LIVE values.
+#
+#  file:   MAGIC, HEADER (k, sum_value, the score per match and rows removed
+#          at multiplier 1, record count), then RECORDs sorted by key
+#  record: key, the best match (positions among the live values), live values
+#          left at the end of the line, score of the line at multiplier 1
+#
+#  only arrangements holding a match have a record. one is found by binary
+#  search over the mapped file, nothing is read up front.
+
+MAGIC = b'NZENDGM1'
+HEADER = Struct('<BB6dI')
+RECORD = Struct('<QBBBd')
+MAX_LIVE = 5
+# (match, rows removed) in the order the header holds their scores
+IMPACTS = tuple(product((1, 2), (0, 1, 2)))
+
+
+def encode(cells, partner):
+    # the key of cells, (row, col, in column 0, ends its row, value) in index order
+    rows = {}
+    cols = {}
+    tokens = {}
+    families = 0
+    key = len(cells)
+    for row, col, first, last, val in cells:
+        token = tokens.get(val)
+        if token is None:
+            token = tokens.get(partner(val))
+            if token is None:
+                # a new value claims both tokens of its pair, even when its complement never turns up
+                token = families * 2
+                families += 1
+            else:
+                token ^= 1
+            tokens[val] = token
+        key = (key << 12) | (rows.setdefault(row, len(rows)) << 9) | (cols.setdefault(col, len(cols)) << 6) | (first << 5) | (last << 4) | token
+    return key
+
+def grid_cells(values, max_width):
+    # (live indices, cells) of a grid
+    indices = [index for index, val in enumerate(values) if val > 0]
+    cells = []
+    for index in indices:
+        row, col = divmod(index, max_width)
+        end = min(row * max_width + max_width, len(values)) - 1
+        cells.append((row, col, int(col == 0), int(index == end), values[index]))
+    return indices, cells
+
+
+### GENERATOR ###
+
+def compositions(total):
+    if total == 0:
+        yield ()
+        return
+    for part in range(1, total + 1):
+        for rest in compositions(total - part):
+            yield (part,) + rest
+
+def layouts(count):
+    # every (row, col, in column 0, ends its row) of count live values, columns
+    # numbered by first appearance. rows are laid out over every set of columns
+    # (narrow grids included), each with or without column 0 and the last column
+    # and with or without the last row ending at its last value
+    found = set()
+    for parts in compositions(count):
+        for width in range(max(parts), count + 1):
+            for rows in product(*(list(combinations(range(width), part)) for part in parts)):
+                if len(set().union(*rows)) < width:
+                    continue
+                for has_first, has_last, tail in product((0, 1), repeat=3):
+                    cells = []
+                    cols = {}
+                    for row, row_cols in enumerate(rows):
+                        for col in row_cols:
+                            last = col == row_cols[-1] and ((has_last and col == width - 1) or (tail and row == len(rows) - 1))
+                            cells.append((row, cols.setdefault(col, len(cols)), int(has_first and col == 0), int(last)))
+                    found.add(tuple(cells))
+    return sorted(found)
+
+def patterns(count, pairs, singles):
+    # every sequence of count value tokens in order of first appearance, with at most
+    # pairs values whose complement is also there and pairs + singles values in all
+    def extend(seq, both):
+        if len(seq) == count:
+            yield seq
+            return
+        used = set(seq)
+        families = (max(seq) >> 1) + 1 if seq else 0
+        for token in sorted(used):
+            yield from extend(seq + (token,), both)
+        if both < pairs:
+            for token in sorted(used):
+                if token ^ 1 not in used and token & 1 == 0:
+                    yield from extend(seq + (token ^ 1,), both + 1)
+        if families < pairs + singles:
+            yield from extend(seq + (families * 2,), both)
+    yield from extend((), 0)
+
+def token_match(t1, t2):
+    if t1 == t2:
+        return 1
+    return 2 if t1 ^ 1 == t2 else 0
+
+def cell_matches(cells, is_match):
+    # {(position, position): match} of every pair, as Puzzle finds them
+    found = {}
+    for pos in range(len(cells) - 1):
+        match = is_match(cells[pos][4], cells[pos + 1][4])
+        if match:
+            found[(pos, pos + 1)] = match
+    prev = {}
+    for pos, cell in enumerate(cells):
+        above = prev.get(cell[1])
+        if above is not None:
+            match = is_match(cells[above][4], cell[4])
+            if match:
+                found[(above, pos)] = match
+        prev[cell[1]] = pos
+    if len(cells) > 1 and cells[0][2] and cells[-1][3]:
+        match = is_match(cells[0][4], cells[-1][4])
+        if match:
+            found[(0, len(cells) - 1)] = match
+    return found
+
+def remove(cells, pos1, pos2):
+    # (cells left after matching pos1 and pos2, rows removed)
+    left = [cell for pos, cell in enumerate(cells) if pos not in (pos1, pos2)]
+    rows = {cell[0] for cell in left}
+    return left, len({cells[pos1][0], cells[pos2][0]} - rows)
+
+
+class Generator:
+
+    def __init__(self, k=4, config=None):
+        if not 1 <= k <= MAX_LIVE:
+            raise ValueError('k must be 1 to {0}'.format(MAX_LIVE))
+        self.k = k
+        puzzle = Puzzle(debug=0, max_width=Defaults.max_width, num_start_rows=1, config=config)
+        self.sum_value = puzzle.sum_value
+        self.scores = {impact: puzzle.score_match(impact[0], 2, impact[1]) / puzzle.multiplier for impact in IMPACTS}
+        complements = sum(1 for val in range(1, 10) if 1 <= self.sum_value - val <= 9 and self.sum_value - val != val)
+        self.pairs = complements // 2
+        self.singles = 9 - complements
+        self.table = {} # key -> (left, score, pos1, pos2)
+
+    def best(self, cells):
+        # (live values left, score, pos1, pos2) of the best line from cells, pos None without a match
+        key = encode(cells, lambda token: token ^ 1)
+        entry = self.table.get(key)
+        if entry is not None:
+            return entry
+        best = (len(cells), 0.0, None, None)
+        for (pos1, pos2), match in cell_matches(cells, token_match).items():
+            left, rows = remove(cells, pos1, pos2)
+            line = self.best(left)
+            score = self.scores[(match, rows)] + line[1]
+            if best[2] is None or (line[0], -score) < (best[0], -best[1]):
+                best = (line[0], score, pos1, pos2)
+        if best[2] is not None:
+            self.table[key] = best
+        return best
+
+    def run(self):
+        # values are dealt in pairs, builds double them and matches take two, so live counts are even
+        for count in range(2, self.k + 1, 2):
+            tokens = list(patterns(count, self.pairs, self.singles))
+            for layout in layouts(count):
+                for seq in tokens:
+                    self.best([cell + (token,) for cell, token in zip(layout, seq)])
+        return self
+
+    def write(self, path):
+        with open(path, 'wb') as dst:
+            dst.write(MAGIC)
+            dst.write(HEADER.pack(self.k, self.sum_value, *(self.scores[impact] for impact in IMPACTS), len(self.table)))
+            for key in sorted(self.table):
+                left, score, pos1, pos2 = self.table[key]
+                dst.write(RECORD.pack(key, pos1, pos2, left, score))
+
+
+### LOOKUP ###
+
+class EndgameTable:
+
+    def __init__(self, path):
+        with open(path, 'rb') as src:
+            self._map = mmap(src.fileno(), 0, access=ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError('{0} is not a numzilla endgame table'.format(path))
+        fields = HEADER.unpack_from(self._map, len(MAGIC))
+        self.k, self.sum_value = fields[:2]
+        self.scores = dict(zip(IMPACTS, fields[2:-1]))
+        self.records = fields[-1]
+        self._start = len(MAGIC) + HEADER.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def check(self, puzzle):
+        # the table only holds for the matching rules and scoring it was generated with
+        same_scores = all(abs(puzzle.score_match(impact[0], 2, impact[1]) / puzzle.multiplier - score) < 1e-9
+                          for impact, score in self.scores.items())
+        if puzzle.sum_value != self.sum_value or not same_scores:
+            raise ValueError('the endgame table was generated for other matching or scoring rules')
+
+    def lookup(self, key):
+        # (pos1, pos2, left, score) stored under key, or None
+        low, high = 0, self.records
+        while low < high:
+            mid = (low + high) // 2
+            record = RECORD.unpack_from(self._map, self._start + mid * RECORD.size)
+            if record[0] == key:
+                return record[1:]
+            if record[0] < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def move(self, puzzle):
+        # the best match of puzzle as (index, index), None past k live values or without a match
+        if puzzle.num_count > self.k:
+            return None
+        indices, cells = grid_cells(puzzle.values, puzzle.max_width)
+        record = self.lookup(encode(cells, lambda val: self.sum_value - val))
+        if record is None:
+            return None
+        return indices[record[0]], indices[record[1]]
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='generate numzilla endgame tables, or play games finishing with one')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help='write the table for up to k live values')
+    generate.add_argument('path')
+    generate.add_argument('--k', type=int, default=4)
+    play = commands.add_parser('play', help='play seeded games without and with the table')
+    play.add_argument('path')
+    play.add_argument('games', type=int)
+    play.add_argument('--seed', type=int, default=0)
+    play.add_argument('--width', type=int, default=Defaults.max_width)
+    play.add_argument('--rows', type=int, default=Defaults.num_start_rows)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        started = perf_counter()
+        generator = Generator(args.k).run()
+        generator.write(args.path)
+        output('### ENDGAME: {0} ARRANGEMENTS OF UP TO {1} LIVE VALUES IN {2:.2f}s | {3} BYTES'.format(
+            len(generator.table), args.k, perf_counter() - started, len(MAGIC) + HEADER.size + RECORD.size * len(generator.table)))
+    else:
+        with EndgameTable(args.path) as endgame:
+            for label, table in (('WITHOUT', None), ('WITH', endgame)):
+                results = [Puzzle(debug=0, max_width=args.width, num_start_rows=args.rows, rng=Random(args.seed + game)).solve(silent=True, endgame=table)
+                           for game in range(args.games)]
+                output('### {0} ENDGAME TABLE'.format(label))
+                output(summary(results))
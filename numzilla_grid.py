@@ -0,0 +1,196 @@
+from array import array
+from itertools import compress
+
+### GRID BACKENDS ###
+#  a backend stores self.values and does the bulk scans over it, everything else
+#  (index lookups, sign flips, shuffles) works on any of them unchanged
+
+class ListGrid:
+    # plain python list of signed values, the reference backend
+
+    @staticmethod
+    def new(values):
+        return list(values)
+
+    @staticmethod
+    def live(values):
+        return [val for val in values if val > 0]
+
+    @staticmethod
+    def live_count(values):
+        return len([val for val in values if val > 0])
+
+    @staticmethod
+    def extend(values, tail):
+        values += tail
+        return values
+
+    @staticmethod
+    def truncate(values, length):
+        del values[length:]
+        return values
+
+    @staticmethod
+    def find_pairs(values, max_width, sum_value, start=0):
+        # every pair whose second value is at or after start, all pairs by default.
+        # after a build start is the old length: the tail, its seam with the last
+        # old live value and the columns it extends
+        row_pairs = {}
+        col_pairs = {}
+
+        # by index
+        prev = ListGrid.last_live(values, start, 1)
+        for index in range(start, len(values)):
+            val = values[index]
+            if val > 0:
+                if prev is not None and (values[prev] == val or values[prev] + val == sum_value):
+                    row_pairs[prev] = index
+                prev = index
+        # by column
+        for col_num in range(max_width):
+            first = start + (col_num - start) % max_width # first index of the column at or after start
+            prev = ListGrid.last_live(values, first, max_width)
+            for index in range(first, len(values), max_width):
+                val = values[index]
+                if val > 0:
+                    if prev is not None and (values[prev] == val or values[prev] + val == sum_value):
+                        col_pairs[prev] = index
+                    prev = index
+        return row_pairs, col_pairs
+
+    @staticmethod
+    def has_pairs(values, max_width, sum_value):
+        # whether find_pairs would find anything, stopping at the first pair
+        prev = None
+        for index, val in enumerate(values):
+            if val > 0:
+                if prev is not None and (values[prev] == val or values[prev] + val == sum_value):
+                    return True
+                prev = index
+        for col_num in range(max_width):
+            prev = None
+            for index in range(col_num, len(values), max_width):
+                val = values[index]
+                if val > 0:
+                    if prev is not None and (values[prev] == val or values[prev] + val == sum_value):
+                        return True
+                    prev = index
+        return False
+
+    @staticmethod
+    def last_live(values, index, step):
+        # last live value before index, stepping back by step
+        for _index in range(index - step, -1, -step):
+            if values[_index] > 0:
+                return _index
+        return None
+
+    @staticmethod
+    def row_counts(values, max_width):
+        return [len([val for val in values[col: col + max_width] if val > 0]) for col in range(0, len(values), max_width)]
+
+    @staticmethod
+    def remove_rows(values, rows, max_width):
+        # a new list without the given (sorted) rows, the old one is left as is for undo
+        kept = values[:0]
+        start = 0
+        for row_num in rows:
+            kept += values[start: row_num * max_width]
+            start = (row_num + 1) * max_width
+        kept += values[start:]
+        return kept
+
+
+### BITBOARDS ###
+#  the grid's signed bytes as one python int, a byte per value. shifting the
+#  live values left by a nibble and adding them to themselves one value on
+#  packs every value and the next into one byte, over the whole grid at once,
+#  and a 256 byte table then says which of those bytes are pairs. everything
+#  per value runs in translate, int.from_bytes / to_bytes and compress, the
+#  python side only ever touches the pairs found.
+
+LIVE = bytes(1 if 0 < byte < 128 else 0 for byte in range(256)) # 1 for a live value, 0 for a used one
+USED = bytes(range(128, 256)) # the bytes of used (negative) values
+PAIR_TABLES = {} # sum_value -> 1 for a (value << 4) + next value byte that matches, 0 otherwise
+
+def pair_table(sum_value):
+    table = PAIR_TABLES.get(sum_value)
+    if table is None:
+        # values are 1 to 9, a 0 is the separator between columns and matches nothing
+        table = PAIR_TABLES[sum_value] = bytes(
+            1 if byte >> 4 and byte & 15 and (byte >> 4 == byte & 15 or (byte >> 4) + (byte & 15) == sum_value) else 0
+            for byte in range(256))
+    return table
+
+def pair_flags(live, sum_value):
+    # one byte per value of live (bytes of live values) but the last, 1 when it matches the next
+    if len(live) < 2:
+        return b''
+    packed = (int.from_bytes(live[:-1], 'big') << 4) + int.from_bytes(live[1:], 'big')
+    return packed.to_bytes(len(live) - 1, 'big').translate(pair_table(sum_value))
+
+def flagged_pairs(positions, flags):
+    # {index: next index} for every flagged value, positions being the index of each value
+    return dict(zip(compress(positions, flags), compress(positions[1:], flags)))
+
+
+class BitboardGrid(ListGrid):
+    # one signed byte per value in an array.array, with every scan done on packed ints,
+    # see BITBOARDS. the columns are scanned as one sequence, separated by a 0 that matches nothing
+
+    @staticmethod
+    def new(values):
+        return array('b', values)
+
+    @staticmethod
+    def live(values):
+        live = array('b')
+        live.frombytes(values.tobytes().translate(None, USED))
+        return live
+
+    @staticmethod
+    def live_count(values):
+        return len(values.tobytes().translate(None, USED))
+
+    @staticmethod
+    def positions(raw, first, step):
+        # the live values of raw[first::step] and the index of each
+        seq = raw[first::step]
+        live = seq.translate(None, USED)
+        if len(live) == len(seq):
+            return live, range(first, len(raw), step)
+        return live, list(compress(range(first, len(raw), step), seq.translate(LIVE)))
+
+    @staticmethod
+    def find_pairs(values, max_width, sum_value, start=0):
+        # pairs whose second value is at or after start, see ListGrid.find_pairs
+        raw = values.tobytes()
+
+        # by index, from the last live value before start
+        prev = ListGrid.last_live(values, start, 1)
+        live, positions = BitboardGrid.positions(raw, start if prev is None else prev, 1)
+        row_pairs = flagged_pairs(positions, pair_flags(live, sum_value))
+        # by column, every column from its last live value before start
+        columns = []
+        col_positions = []
+        for col_num in range(max_width):
+            first = start + (col_num - start) % max_width
+            prev = ListGrid.last_live(values, first, max_width)
+            live, positions = BitboardGrid.positions(raw, first if prev is None else prev, max_width)
+            columns.append(live)
+            col_positions.extend(positions)
+            col_positions.append(None)
+        col_pairs = flagged_pairs(col_positions, pair_flags(b'\0'.join(columns), sum_value))
+        return row_pairs, col_pairs
+
+    @staticmethod
+    def has_pairs(values, max_width, sum_value):
+        raw = values.tobytes()
+        if 1 in pair_flags(raw.translate(None, USED), sum_value):
+            return True
+        return 1 in pair_flags(b'\0'.join(raw[col_num::max_width].translate(None, USED) for col_num in range(max_width)), sum_value)
+
+    @staticmethod
+    def row_counts(values, max_width):
+        live = values.tobytes().translate(LIVE)
+        return [live.count(1, start, start + max_width) for start in range(0, len(live), max_width)]
@@ -0,0 +1,293 @@
+from bisect import bisect_left
+
+### MATCH INDEX ###
+#  every match of the grid as (index, index), kept in the order a full scan
+#  finds them: the wrap around pair (first and last value), the pairs by index
+#  (keyed by their first index), then the pairs by column (keyed by column, then
+#  first index). find_match draws from that order and grid_value judges reuse
+#  by it, so an index kept up to date is the same as one rebuilt by find_all.
+#
+#  a match only changes the pairs around the two values it used, a build adds
+#  the pairs of its tail and a row removal renumbers every pair without changing
+#  their order, so none of them rescans or re-sorts the grid. every change made
+#  under an undo log is logged as (function, arguments) undoing it, see
+#  Puzzle.undo. what grid_value needs (the matches holding each value and a
+#  count of the reused ones) is only kept once it has been read, see tally_matches,
+#  and what hints needs (every match filed by impact) once hints are asked for.
+
+WRAP_KEY = -1
+COL_KEY = 1 << 48
+
+def undo_entry(mapping, key):
+    # the change log entry putting mapping[key] back as it is now
+    old = mapping.get(key)
+    return (mapping.pop, key, None) if old is None else (mapping.__setitem__, key, old)
+
+
+class MatchIndexMixin:
+
+    __slots__ = ('_matches', '_match_keys', '_cells', '_hints', '_filed', '_row_pairs', '_col_pairs', '_grid_matches',
+                 '_grid_tally')
+
+    def next_live(self, index, step):
+        index += step
+        while 0 <= index < len(self.values):
+            if self.values[index] > 0:
+                return index
+            index += step
+        return None
+
+    def update_matches(self, *indices):
+        # refresh the index around values whose live state changed: only the pairs
+        # between each value and its next live neighbours by index and by column can change
+        changes = self._undo[-1][3] if self._undo is not None else None
+        for index in indices:
+            for step, pairs in ((1, self._row_pairs), (self._max_width, self._col_pairs)):
+                prev = self.next_live(index, -step)
+                _next = self.next_live(index, step)
+                if self.values[index] > 0:
+                    own = _next if _next is not None and self.is_match(self.values[index], self.values[_next]) else None
+                    before = index
+                else:
+                    own = None
+                    before = _next
+                if prev is not None and (before is None or not self.is_match(self.values[prev], self.values[before])):
+                    before = None
+                if pairs.get(index) != own:
+                    self.put_pair(pairs, index, own, changes)
+                if prev is not None and pairs.get(prev) != before:
+                    self.put_pair(pairs, prev, before, changes)
+        self.update_wrap()
+        if self._hints is not None:
+            # a row only removes itself once it's down to its last two values
+            self.refile_rows({index // self._max_width for index in indices if self._row_live[index // self._max_width] <= 2})
+
+    def extend_matches(self, start):
+        # values were only appended from start on, so every existing pair holds and
+        # the new ones all start at values that had no pair (the last live values
+        # by index and in each column)
+        row_pairs, col_pairs = self._grid.find_pairs(self.values, self._max_width, self._sum_value, start)
+        changes = self._undo[-1][3] if self._undo is not None else None
+        added = []
+        for pairs, found in ((self._row_pairs, row_pairs), (self._col_pairs, col_pairs)):
+            for index, _index in found.items():
+                if changes is not None:
+                    changes.append(undo_entry(pairs, index))
+                pairs[index] = _index
+                added.append((self.match_key(index, pairs is self._col_pairs), index, _index))
+        self.add_matches(sorted(added), changes)
+        self.update_wrap()
+        if self._hints is not None:
+            # the tail may have filled up the last row
+            self.refile_rows((start // self._max_width,))
+
+    def shift_matches(self, rows_removed):
+        # removed rows only hold used values, so every match survives with the same
+        # neighbours and reuse and only moves up: the index keeps its order and is renumbered
+        def shift(index):
+            return index - self._max_width * bisect_left(rows_removed, index // self._max_width)
+        moved = {}
+        for key, (i1, i2) in zip(self._match_keys, self._matches):
+            _i1 = shift(i1)
+            moved[(key, i1, i2)] = (key if key == WRAP_KEY else self.match_key(_i1, key >= COL_KEY), _i1, shift(i2))
+        self._match_keys = [match[0] for match in moved.values()]
+        self._matches = [match[1:] for match in moved.values()]
+        if self._cells is not None:
+            self._cells = {shift(index): tuple(moved[match] for match in held) for index, held in self._cells.items()}
+        self._row_pairs = {shift(index): shift(_index) for index, _index in self._row_pairs.items()}
+        self._col_pairs = {shift(index): shift(_index) for index, _index in self._col_pairs.items()}
+        if self._hints is not None:
+            self._hints = {impact: [moved[match] for match in bucket] for impact, bucket in self._hints.items()}
+            self._filed = {match[0]: impact for impact, bucket in self._hints.items() for match in bucket}
+        self.update_wrap()
+
+    def match_key(self, index, by_column):
+        # position in the index of the pair starting at index
+        if by_column:
+            return COL_KEY + ((index % self._max_width) << 32) + index
+        return index
+
+    def wrap_match(self):
+        # the first value also pairs with the last (by index, _row_match)
+        last = len(self.values) - 1
+        if last > 0 and self.values[0] > 0 and self.values[last] > 0 and self.is_match(self.values[0], self.values[last]):
+            return (WRAP_KEY, 0, last)
+        return None
+
+    def put_pair(self, pairs, index, _index, changes):
+        # points pairs[index] at _index (None drops it) and the match list with it
+        old = pairs.get(index)
+        key = self.match_key(index, pairs is self._col_pairs)
+        if changes is not None:
+            changes.append(undo_entry(pairs, index))
+        if old is not None:
+            del pairs[index]
+            self.drop_match((key, index, old), changes)
+        if _index is not None:
+            pairs[index] = _index
+            self.add_match((key, index, _index), changes)
+
+    def update_wrap(self):
+        # the wrap around pair follows the ends of the grid, checked once an operation is done
+        changes = self._undo[-1][3] if self._undo is not None else None
+        old = (WRAP_KEY,) + self._matches[0] if self._match_keys and self._match_keys[0] == WRAP_KEY else None
+        wrap = self.wrap_match()
+        if wrap != old:
+            if old is not None:
+                self.drop_match(old, changes)
+            if wrap is not None:
+                self.add_match(wrap, changes)
+        self._grid_matches = len(self._matches)
+
+    def add_match(self, match, changes):
+        # match is (key, index, index)
+        pos = bisect_left(self._match_keys, match[0])
+        self._match_keys.insert(pos, match[0])
+        self._matches.insert(pos, match[1:])
+        if changes is not None:
+            changes.append((self._match_keys.pop, pos))
+            changes.append((self._matches.pop, pos))
+        self.file_match(match, True, changes)
+
+    def add_matches(self, matches, changes):
+        # matches is sorted, each run of them going to the same place is inserted at once
+        runs = {}
+        for match in matches:
+            runs.setdefault(bisect_left(self._match_keys, match[0]), []).append(match)
+        for pos in sorted(runs, reverse=True):
+            run = runs[pos]
+            self._match_keys[pos:pos] = [match[0] for match in run]
+            self._matches[pos:pos] = [match[1:] for match in run]
+            if changes is not None:
+                changes.append((self._match_keys.__delitem__, slice(pos, pos + len(run))))
+                changes.append((self._matches.__delitem__, slice(pos, pos + len(run))))
+        for match in matches:
+            self.file_match(match, True, changes)
+
+    def drop_match(self, match, changes):
+        pos = bisect_left(self._match_keys, match[0])
+        del self._match_keys[pos]
+        del self._matches[pos]
+        if changes is not None:
+            changes.append((self._match_keys.insert, pos, match[0]))
+            changes.append((self._matches.insert, pos, match[1:]))
+        self.file_match(match, False, changes)
+
+    def file_match(self, match, add, changes):
+        # adds match to (or drops it from) the cells it holds and the tally. reuse only depends on
+        # the earlier matches holding the same values, so only later ones sharing them can change
+        cells = self._cells
+        if cells is None:
+            return
+        key, i1, i2 = match
+        held1 = cells.get(i1, ())
+        held2 = cells.get(i2, ())
+        later = [other for other in held1 + held2 if other[0] > key]
+        if len(later) > 1:
+            later = set(later)
+        if changes is not None:
+            changes.append(undo_entry(cells, i1))
+            changes.append(undo_entry(cells, i2))
+        if add:
+            # the fresh ones turn reused
+            later = [other for other in later if not self.reused(other)]
+            cells[i1] = held1 + (match,) if not held1 or held1[-1][0] < key else tuple(sorted(held1 + (match,)))
+            cells[i2] = held2 + (match,) if not held2 or held2[-1][0] < key else tuple(sorted(held2 + (match,)))
+            reused = self.reused(match)
+        else:
+            reused = self.reused(match)
+            for index, held in ((i1, held1), (i2, held2)):
+                if len(held) > 1:
+                    cells[index] = tuple(other for other in held if other != match)
+                else:
+                    del cells[index]
+            # the ones it was the only earlier match for turn fresh
+            later = [other for other in later if not self.reused(other)]
+        sign = 1 if add else -1
+        tally = list(self._grid_tally)
+        slot = 2 * (key >= COL_KEY)
+        tally[slot] += sign
+        tally[slot + 1] += sign * reused
+        for other in later:
+            tally[2 * (other[0] >= COL_KEY) + 1] += sign
+        self._grid_tally = tuple(tally)
+        if self._hints is not None:
+            self.file_hint(match, add)
+
+    def reused(self, match):
+        # whether an earlier match holds either of its values
+        return self._cells[match[1]][0][0] < match[0] or self._cells[match[2]][0][0] < match[0]
+
+    def collect_matches(self):
+        # the whole index from the pairs, laid out in the order of a full scan (the wrap
+        # around pair, by index, by column) which is what reuse is judged by
+        found = [(self.match_key(index, pairs is self._col_pairs), index, _index)
+                 for pairs in (self._row_pairs, self._col_pairs) for index, _index in pairs.items()]
+        wrap = self.wrap_match()
+        if wrap is not None:
+            found.append(wrap)
+        found.sort()
+        self._match_keys = [match[0] for match in found]
+        self._matches = [match[1:] for match in found]
+        self._grid_matches = len(found)
+        if self._cells is not None:
+            self.tally_matches()
+        self._hints = None
+
+    def tally_matches(self):
+        # files every match under the values it holds and counts them for grid_value. only done
+        # once grid_value is asked for, from then on file_match keeps both up to date
+        self._cells = {}
+        tally = [0, 0, 0, 0]
+        for key, (i1, i2) in zip(self._match_keys, self._matches):
+            match = (key, i1, i2)
+            held1 = self._cells.get(i1, ())
+            held2 = self._cells.get(i2, ())
+            tally[2 * (key >= COL_KEY)] += 1
+            tally[2 * (key >= COL_KEY) + 1] += bool(held1 or held2)
+            self._cells[i1] = held1 + (match,)
+            self._cells[i2] = held2 + (match,)
+        self._grid_tally = tuple(tally)
+
+    def impact(self, match):
+        # (match, rows it would remove going by the live counts)
+        _, i1, i2 = match
+        r1 = i1 // self._max_width
+        r2 = i2 // self._max_width
+        if r1 == r2:
+            rows = 1 if self._row_live[r1] == 2 else 0
+        else:
+            rows = (self._row_live[r1] == 1) + (self._row_live[r2] == 1)
+        return self.is_match(self.values[i1], self.values[i2]), rows
+
+    def rank_matches(self):
+        # file every match under its impact, each bucket in index order. reuse is read from
+        # the cells, so this starts tracking them. from then on file_hint keeps the buckets up to date
+        if self._cells is None:
+            self.tally_matches()
+        self._hints = {}
+        self._filed = {}
+        for key, (i1, i2) in zip(self._match_keys, self._matches):
+            match = (key, i1, i2)
+            impact = self.impact(match)
+            self._hints.setdefault(impact, []).append(match)
+            self._filed[key] = impact
+
+    def file_hint(self, match, add):
+        # adds match to (or drops it from) its bucket
+        if add:
+            impact = self._filed[match[0]] = self.impact(match)
+            bucket = self._hints.setdefault(impact, [])
+            bucket.insert(bisect_left(bucket, match), match)
+        else:
+            bucket = self._hints[self._filed.pop(match[0])]
+            del bucket[bisect_left(bucket, match)]
+
+    def refile_rows(self, rows):
+        # the impact of the matches holding a value in rows follows their live counts
+        for row in rows:
+            for index in range(row * self._max_width, min(row * self._max_width + self._max_width, len(self.values))):
+                for match in self._cells.get(index, ()):
+                    if self._filed[match[0]] != self.impact(match):
+                        self.file_hint(match, False)
+                        self.file_hint(match, True)
@@ -0,0 +1,568 @@
+from argparse import ArgumentParser
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+
+import numpy as np
+
+from numzilla import CONFIG, Defaults, GameResult, output
+
+### LOCKSTEP SIMULATION ###
+#  plays a whole batch of games at once. every game is a row of one set of
+#  arrays (struct-of-arrays) and each tick advances every unfinished game by
+#  one solve step: match if a match exists, else stop when the grid is empty,
+#  else scramble if enabled, else build. the rules are those of Puzzle.play,
+#  Puzzle.cleanup and Puzzle.score_match, written as array operations.
+#
+#  grids are padded with 0 past their length, so a cell is live when > 0,
+#  used when < 0 and padding when 0.
+#
+#  matches are never rescanned on a plain match: every live value links to the
+#  next and previous live values by index and in its column, so using a value
+#  only relinks its neighbours and rejudges the one pair that pointed at it. a
+#  build links the old grid's last live values to its tail. only row removal
+#  and scramble, which move values around, rescan (those games only). pairs are
+#  also counted per row of the grid, so a match is drawn uniformly (as find_match
+#  does) by counting through the rows and then through one row only.
+#
+#  config overrides Defaults as Puzzle(config=...) does (constructive_shuffle
+#  isn't played in lockstep), and run takes Puzzle.play's budgets per game, a
+#  game running out of one finishing as unterminated. all games start together,
+#  so time_budget is the run's time. repeats compare the live value counts of
+#  every scramble, the multiset play hashes.
+#
+#  this is an experimental path: a tick costs about the same with one game left
+#  as with a hundred and a run lasts as long as its longest game, so with 2000
+#  games it plays about 3 times as many games a second as Puzzle.play on one
+#  core, and below a few hundred games it is slower.
+
+MATCH = 1
+BUILD = 2
+SCRAMBLE = 3
+GENERATE = 4
+
+CHUNK = 256 # games scanned together, small enough for the scratch arrays to stay in cache
+SORT_TICKS = 32 # ticks between dropping finished games (and re-sorting by grid length past CHUNK games)
+
+NONE = np.int32(1 << 30) # marks a missing next live value while scanning
+
+# arrays holding one entry per game still in play
+GAME_ARRAYS = ('ids', 'values', 'length', 'num_count', 'score', 'multiplier', 'build_count',
+               'consecutive_builds', 'prev_action', 'enable_scramble', 'repeats',
+               'row_next', 'row_prev', 'col_next', 'col_prev', 'pairs', 'pair_counts', 'pair_total', 'wrap_pairs',
+               'steps', 'max_rows', 'matches', 'builds', 'scrambles', 'multis')
+
+# arrays sized by the cells of every game still in play (two per cell for pairs, one per row for pair_counts)
+CELL_ARRAYS = ('values', 'row_next', 'row_prev', 'col_next', 'col_prev', 'pairs', 'pair_counts')
+
+class Lockstep:
+
+    def __init__( # pylint: disable=too-many-arguments,too-many-positional-arguments
+            self,
+            games,
+            max_width=Defaults.max_width,
+            num_start_rows=Defaults.num_start_rows,
+            seed=None,
+            config=None):
+
+        config = {} if config is None else config
+        unknown = [name for name in config if name not in CONFIG]
+        if unknown:
+            raise ValueError('unknown config {0}'.format(', '.join(unknown)))
+        if config.get('constructive_shuffle'):
+            raise ValueError('constructive_shuffle is not played in lockstep')
+        settings = {name: config.get(name, getattr(Defaults, name)) for name in CONFIG}
+
+        self.rng = np.random.default_rng(seed)
+        self._max_width = max_width
+        self._num_start_rows = num_start_rows
+        self._sum_value = settings['sum_value']
+        self._single_score = settings['single_score']
+        self._row_score = settings['row_score']
+        self._scramble_rows = settings['scramble_rows']
+        self._build_scramble_threshold = settings['build_scramble_threshold']
+        self._build_count_min = settings['build_count_min']
+        self._build_count_max = settings['build_count_max']
+        self._sum_multiplier = settings['sum_multiplier']
+        self._weighted_multiplier = settings['weighted_multiplier']
+
+        # multiplier tables, a game picks from the population without its current multiplier
+        self._multiplier_population = list(settings['multiplier_population'])
+        population = np.array(self._multiplier_population)
+        self._multiplier_median = median(self._multiplier_population)
+        self._population = np.array([population[population != multi] for multi in population])
+        self._population_index = np.zeros(population.max() + 1, dtype=np.int64) # multiplier -> its row of _population
+        self._population_index[population] = np.arange(len(population))
+        weights = np.array([settings['multipliers_weights_current_low'], settings['multipliers_weights_current_high']], dtype=float)
+        self._weights = np.cumsum(weights / weights.sum(axis=1, keepdims=True), axis=1)
+
+        # per game budgets, see run
+        self._max_steps = None
+        self._max_repeats = None
+        self._deadline = None
+        self._start = perf_counter()
+
+        self.games = games
+        self.ids = np.arange(games) # game number of every row still in play
+
+        # grid state
+        length = num_start_rows * max_width
+        length += length % 2
+        self.values = np.zeros((games, -(-length // max_width) * max_width), dtype=np.int8)
+        self.length = np.full(games, length)
+        self.num_count = np.full(games, length)
+        # scores stay whole numbers unless the scoring config isn't
+        whole = all(isinstance(settings[name], int) for name in ('single_score', 'row_score', 'sum_multiplier'))
+        self.score = np.zeros(games, dtype=np.int64 if whole else np.float64)
+        self.multiplier = np.full(games, settings['multiplier'])
+        self.build_count = np.zeros(games, dtype=np.int64)
+        self.consecutive_builds = np.zeros(games, dtype=np.int64)
+        self.prev_action = np.zeros(games, dtype=np.int8)
+        self.enable_scramble = np.zeros(games, dtype=bool)
+
+        # match state, see rescan. links are cell indices, -1 where there is no live value
+        cells = self.values.shape[1]
+        self.row_next = np.full((games, cells), -1, dtype=np.int32) # next live value by index
+        self.row_prev = np.full((games, cells), -1, dtype=np.int32)
+        self.col_next = np.full((games, cells), -1, dtype=np.int32) # next live value in the column
+        self.col_prev = np.full((games, cells), -1, dtype=np.int32)
+        self.pairs = np.zeros((games, 2 * cells), dtype=bool) # at cell * 2 by index, cell * 2 + 1 by column
+        self.pair_counts = np.zeros((games, cells // max_width), dtype=np.int32) # pairs starting in each row
+        self.pair_total = np.zeros(games, dtype=np.int64)
+        self.wrap_pairs = np.zeros(games, dtype=bool)
+        self.grid_matches = None
+
+        # statistics, per row in play and per game once finished
+        self.steps = np.zeros(games, dtype=np.int64)
+        self.max_rows = np.zeros(games, dtype=np.int64)
+        self.matches = np.zeros(games, dtype=np.int64)
+        self.builds = np.zeros(games, dtype=np.int64)
+        self.scrambles = np.zeros(games, dtype=np.int64)
+        self.multis = np.zeros((games, population.max() + 1), dtype=np.int64)
+        self.multis[:, settings['multiplier']] = 1
+        self.repeats = np.zeros(games, dtype=np.int64)
+        self.seen = {} # game -> {live value counts: times dealt}, the start and every scramble
+        self.results = {}
+        self.ticks = 0
+
+        self.generate()
+
+    ### GRID OPERATIONS ###
+
+    def generate(self):
+        half = self.length[0] // 2
+        pairs = self.rng.integers(1, 10, size=(self.games, half), dtype=np.int8)
+        self.values[:, :2 * half] = np.repeat(pairs, 2, axis=1)
+        self.shuffle(np.ones(self.games, dtype=bool))
+        self.deal(np.arange(self.games))
+        self.cleanup(np.full(self.games, GENERATE))
+
+    def deal(self, rows):
+        # counts the live values of the given games as dealt once more, returns whether each is a repeat
+        values = self.values[rows, :self.columns(self.length[rows])]
+        live = values > 0
+        counts = np.bincount((np.arange(len(rows))[:, None] * 10 + values)[live], minlength=10 * len(rows)).reshape((-1, 10))[:, 1:]
+        repeat = np.zeros(len(rows), dtype=bool)
+        for pos, (game, key) in enumerate(zip(self.ids[rows].tolist(), map(tuple, counts.tolist()))):
+            dealt = self.seen.setdefault(game, {})
+            dealt[key] = dealt.get(key, 0) + 1
+            repeat[pos] = dealt[key] > 1
+        return repeat
+
+    def shuffle(self, games):
+        # compact and shuffle the live values of the given games until each has a match
+        rows = np.flatnonzero(games)
+        while len(rows) > 0:
+            values = self.values[rows]
+            keys = self.rng.random(values.shape)
+            keys[values <= 0] = 2
+            values = np.take_along_axis(values, np.argsort(keys, axis=1), axis=1)
+            values[np.arange(values.shape[1]) >= self.num_count[rows, None]] = 0
+            self.values[rows] = values
+            self.length[rows] = self.num_count[rows]
+            rows = rows[~self.rescan(rows)]
+
+    def columns(self, length):
+        return max(-(-int(length.max(initial=0)) // self._max_width) * self._max_width, self._max_width)
+
+    def rescan(self, rows):
+        # links and pairs of the given games from scratch, returns whether each has a match.
+        # games are kept sorted by length, so each chunk only scans as far as its own longest grid
+        found = np.zeros(len(rows), dtype=bool)
+        for offset in range(0, len(rows), CHUNK):
+            sub = rows[offset: offset + CHUNK]
+            cols = self.columns(self.length[sub])
+            row_next, row_prev, col_next, col_prev, pairs, wrap_pairs = self.scan(self.values[sub, :cols], self.length[sub])
+            self.row_next[sub, :cols] = row_next
+            self.row_prev[sub, :cols] = row_prev
+            self.col_next[sub, :cols] = col_next
+            self.col_prev[sub, :cols] = col_prev
+            self.pairs[sub] = False
+            self.pairs[sub, :2 * cols] = pairs
+            self.pair_counts[sub] = 0
+            self.pair_counts[sub, :cols // self._max_width] = pairs.reshape((len(sub), -1, 2 * self._max_width)).sum(axis=2)
+            self.pair_total[sub] = pairs.sum(axis=1)
+            self.wrap_pairs[sub] = wrap_pairs
+            found[offset: offset + CHUNK] = (self.pair_total[sub] > 0) | wrap_pairs
+        return found
+
+    def scan(self, values, length):
+        # the next live value after each cell is a suffix minimum over the indices of live
+        # values, the previous one a prefix maximum, and the same down every column
+        width = self._max_width
+        games, cols = values.shape
+        live = values > 0
+        index = np.arange(cols, dtype=np.int32)
+
+        # by index
+        row_next = np.full((games, cols), -1, dtype=np.int32)
+        row_next[:, :-1] = np.minimum.accumulate(np.where(live, index, NONE)[:, :0:-1], axis=1)[:, ::-1]
+        row_prev = np.full((games, cols), -1, dtype=np.int32)
+        row_prev[:, 1:] = np.maximum.accumulate(np.where(live, index, -1), axis=1)[:, :-1]
+
+        # by column
+        grid = np.where(live, index, NONE).reshape((games, -1, width))
+        col_next = np.full(grid.shape, -1, dtype=np.int32)
+        col_next[:, :-1] = np.minimum.accumulate(grid[:, :0:-1], axis=1)[:, ::-1]
+        grid = np.where(live, index, -1).reshape((games, -1, width))
+        col_prev = np.full(grid.shape, -1, dtype=np.int32)
+        col_prev[:, 1:] = np.maximum.accumulate(grid, axis=1)[:, :-1]
+        col_next = col_next.reshape(games, cols)
+        col_prev = col_prev.reshape(games, cols)
+        row_next[row_next == NONE] = -1
+        col_next[col_next == NONE] = -1
+
+        # a pair sits at its first value, by index at cell * 2 and by column at cell * 2 + 1
+        pairs = np.empty((games, cols, 2), dtype=bool)
+        for kind, link in enumerate((row_next, col_next)):
+            pairs[:, :, kind] = live & (link >= 0) & self.is_match(values, np.take_along_axis(values, np.maximum(link, 0), axis=1))
+        pairs = pairs.reshape(games, 2 * cols)
+
+        # the first value wraps around to the last
+        first = values[:, 0]
+        last = values[np.arange(games), np.maximum(length - 1, 0)]
+        wrap_pairs = (length > 1) & (first > 0) & (last > 0) & self.is_match(first, last)
+        return row_next, row_prev, col_next, col_prev, pairs, wrap_pairs
+
+    def rewrap(self, rows):
+        first = self.values[rows, 0]
+        last = self.values[rows, np.maximum(self.length[rows] - 1, 0)]
+        self.wrap_pairs[rows] = (self.length[rows] > 1) & (first > 0) & (last > 0) & self.is_match(first, last)
+
+    def set_pairs(self, rows, codes, paired):
+        # codes and paired hold a few changes per game (no code twice for a game), counted as they go
+        rows = rows[:, None]
+        pairs = self.pairs.ravel()
+        at = rows * self.pairs.shape[1] + codes
+        change = paired.astype(np.int32) - pairs[at]
+        pairs[at] = paired
+        np.add.at(self.pair_counts.ravel(), rows * self.pair_counts.shape[1] + codes // (2 * self._max_width), change)
+        self.pair_total[rows[:, 0]] += change.sum(axis=1)
+
+    def use(self, rows, cells):
+        # one value of each game is used: its neighbours now link to each other, and the one
+        # pair that pointed at it (by index and by column) now points past it or is gone.
+        # cells are addressed in the flattened arrays, base + cell
+        base = rows * self.values.shape[1]
+        at = base + cells
+        values = self.values.ravel()
+        values[at] *= -1
+        kinds = np.array([0, 1])
+        self.set_pairs(rows, 2 * cells[:, None] + kinds, np.zeros((len(rows), 2), dtype=bool))
+        firsts = np.empty((len(rows), 2), dtype=np.int64)
+        paired = np.empty((len(rows), 2), dtype=bool)
+        for kind, links, back in ((0, self.row_next, self.row_prev), (1, self.col_next, self.col_prev)):
+            links = links.ravel()
+            back = back.ravel()
+            prev = back[at]
+            _next = links[at]
+            before = prev >= 0
+            after = _next >= 0
+            # the used value's own links and pairs are stale now, so they take the writes with nowhere to go
+            links[np.where(before, base + prev, at)] = _next
+            back[np.where(after, base + _next, at)] = prev
+            firsts[:, kind] = np.where(before, prev, cells)
+            paired[:, kind] = before & after & self.is_match(values[base + np.maximum(prev, 0)], values[base + np.maximum(_next, 0)])
+        self.set_pairs(rows, 2 * firsts + kinds, paired)
+
+    def link_tail(self, rows, live, offset, count):
+        # a build appended count live values at offset. the grid before it keeps its links and
+        # pairs, only its last live values (by index and in each column) now lead into the tail
+        width = self._max_width
+        cols = live.shape[1]
+        col_last = np.where(live, np.arange(cols), -1).reshape((len(rows), -1, width)).max(axis=1)
+        last = col_last.max(axis=1)
+        game, pos = np.nonzero(np.arange(int(count.max(initial=0))) < count[:, None])
+        sub = rows[game]
+        cells = offset[game] + pos
+        tail = count[game]
+        above = np.where(pos >= width, cells - width, col_last[game, cells % width])
+        self.row_next[sub, cells] = np.where(pos + 1 < tail, cells + 1, -1)
+        self.row_prev[sub, cells] = np.where(pos > 0, cells - 1, last[game])
+        self.col_next[sub, cells] = np.where(pos + width < tail, cells + width, -1)
+        self.col_prev[sub, cells] = above
+        head = (pos == 0) & (last[game] >= 0)
+        self.row_next[sub[head], last[game][head]] = cells[head]
+        tops = (pos < width) & (above >= 0)
+        self.col_next[sub[tops], above[tops]] = cells[tops]
+
+        # (mask, first, second, kind) of every pair that can be new
+        found = [(head, last[game], cells, 0), (pos + 1 < tail, cells, cells + 1, 0),
+                 (tops, above, cells, 1), (pos + width < tail, cells, cells + width, 1)]
+        sub = np.concatenate([sub[mask] for mask, *_ in found])
+        first = np.concatenate([i1[mask] for mask, i1, _, _ in found])
+        second = np.concatenate([i2[mask] for mask, _, i2, _ in found])
+        kinds = np.concatenate([np.full(mask.sum(), kind) for mask, _, _, kind in found])
+        paired = self.is_match(self.values[sub, first], self.values[sub, second])
+        sub, codes = sub[paired], (2 * first + kinds)[paired]
+        self.pairs[sub, codes] = True
+        np.add.at(self.pair_counts, (sub, codes // (2 * width)), 1)
+        np.add.at(self.pair_total, sub, 1)
+
+    def is_match(self, v1, v2):
+        return (v1 == v2) | (v1 + v2 == self._sum_value)
+
+    def match(self, games):
+        rows = np.flatnonzero(games)
+        if len(rows) == 0:
+            return
+        width = self._max_width
+
+        # pick uniformly among wrap, by index and by column matches, as find_match does:
+        # the row holding the pick-th pair by the pair counts, then the pair within that row
+        total = self.pair_total[rows]
+        pick = (self.rng.random(len(rows)) * (total + self.wrap_pairs[rows])).astype(np.int64)
+        span = 2 * width
+        grid_rows = self.columns(self.length[rows]) // width
+        counts = self.pair_counts[rows, :grid_rows]
+        upto = np.cumsum(counts, axis=1)
+        row = np.minimum((upto <= pick[:, None]).sum(axis=1), grid_rows - 1)
+        nth = pick - upto[np.arange(len(rows)), row] + counts[np.arange(len(rows)), row]
+        in_row = self.pairs[rows[:, None], row[:, None] * span + np.arange(span)]
+        code = row * span + np.argmax(np.cumsum(in_row, axis=1) > nth[:, None], axis=1)
+        i1 = code >> 1
+        i2 = np.where(code & 1, self.col_next[rows, i1], self.row_next[rows, i1])
+        wrap = pick == total
+        i1[wrap] = 0
+        i2[wrap] = self.length[rows[wrap]] - 1
+
+        v1 = self.values[rows, i1]
+        v2 = self.values[rows, i2]
+        self.use(rows, i1)
+        self.use(rows, i2)
+        self.rewrap(rows)
+        self.num_count[rows] -= 2
+
+        # only the rows of the two cleared values can have emptied
+        r1 = i1 // width
+        r2 = i2 // width
+        cells = np.arange(width)
+        empty1 = ~(self.values[rows[:, None], r1[:, None] * width + cells] > 0).any(axis=1)
+        empty2 = ~(self.values[rows[:, None], r2[:, None] * width + cells] > 0).any(axis=1) & (r2 != r1)
+        row_count = empty1.astype(np.int64) + empty2
+        if row_count.any():
+            self.row_removal(rows, np.where(empty1, r1, -1), np.where(empty2, r2, -1))
+
+        match = np.where(v1 == v2, 0, 1)
+        self.score[rows] += self.multiplier[rows] * (self._sum_multiplier ** match) * (
+            self._single_score * 2 + self._row_score * row_count)
+        self.matches[rows] += 1
+
+    def row_removal(self, rows, r1, r2):
+        width = self._max_width
+        removing = (r1 >= 0) | (r2 >= 0)
+        rows, r1, r2 = rows[removing], r1[removing], r2[removing]
+        grid = self.values[rows].reshape(len(rows), -1, width)
+        row_nums = np.arange(grid.shape[1])
+        removed = (row_nums == r1[:, None]) | (row_nums == r2[:, None])
+
+        # removed rows go to the end as padding, the rest keep their order
+        sizes = np.clip(self.length[rows, None] - row_nums * width, 0, width)
+        grid = np.take_along_axis(grid, np.argsort(removed, axis=1, kind='stable')[:, :, None], axis=1)
+        grid[row_nums >= grid.shape[1] - removed.sum(axis=1)[:, None]] = 0
+        self.values[rows] = grid.reshape(len(rows), -1)
+        self.length[rows] -= (sizes * removed).sum(axis=1)
+        self.rescan(rows)
+
+    def build(self, games):
+        rows = np.flatnonzero(games)
+        if len(rows) == 0:
+            return
+        needed = int((self.length[rows] + self.num_count[rows]).max())
+        if needed > self.values.shape[1]:
+            self.resize(-(-max(needed, 2 * self.values.shape[1]) // self._max_width) * self._max_width)
+
+        cols = self.columns(self.length[rows])
+        values = self.values[rows, :cols]
+        live = values > 0
+        rank = np.cumsum(live, axis=1) - 1
+        sub, index = np.nonzero(live)
+        self.values[rows[sub], self.length[rows[sub]] + rank[sub, index]] = values[sub, index]
+        self.link_tail(rows, live, self.length[rows], self.num_count[rows])
+        self.length[rows] += self.num_count[rows]
+        self.rewrap(rows)
+        self.num_count[rows] *= 2
+        self.build_count[rows] += 1
+        self.builds[rows] += 1
+
+    def resize(self, cols):
+        # every cell array grown (padded as empty) or cut to cols cells
+        cells = self.values.shape[1]
+        for name in CELL_ARRAYS:
+            array = getattr(self, name)
+            size = cols * array.shape[1] // cells
+            if size < array.shape[1]:
+                # a copy, cell arrays are written through flat views
+                array = array[:, :size].copy()
+            else:
+                array = np.pad(array, ((0, 0), (0, size - array.shape[1])), constant_values=-1 if name.endswith(('_next', '_prev')) else 0)
+            setattr(self, name, array)
+
+    def scramble(self, games):
+        rows = np.flatnonzero(games)
+        if len(rows) == 0:
+            return
+        self.build_count[rows] = 0
+        self.shuffle(games)
+        self.set_score_multiplier(rows)
+        self.scrambles[rows] += 1
+        self.multis[rows, self.multiplier[rows]] += 1
+        self.repeats[rows] += self.deal(rows)
+
+    def set_score_multiplier(self, rows):
+        current = self.multiplier[rows]
+        if self._weighted_multiplier:
+            high = (current > self._multiplier_median).astype(np.int64)
+            pick = (self.rng.random(len(rows))[:, None] > self._weights[high]).sum(axis=1)
+            pick = np.minimum(pick, self._population.shape[1] - 1)
+        else:
+            pick = self.rng.integers(0, self._population.shape[1], len(rows))
+        self.multiplier[rows] = self._population[self._population_index[current], pick]
+
+    ### DECISION RULES ###
+
+    def cleanup(self, actions):
+        builds = (actions == BUILD) & (self.prev_action == BUILD)
+        self.consecutive_builds = np.where(builds, self.consecutive_builds + 1, 0)
+        self.prev_action = actions.astype(np.int8)
+
+        self.grid_matches = self.pair_total + self.wrap_pairs
+        row_count = -(-self.length // self._max_width)
+        scramble_rows = row_count >= self._scramble_rows * 0.4
+        few_matches = self.grid_matches <= self._build_scramble_threshold
+        density = self.num_count / np.maximum(row_count, 1)
+        full = row_count >= self._scramble_rows
+
+        enable = (self.grid_matches == 0) & (self.consecutive_builds == 2) & scramble_rows
+        rule1 = (self.consecutive_builds == 2) & (density >= 0.4) & scramble_rows & few_matches
+        rule2 = ~rule1 & (self.consecutive_builds == 3) & scramble_rows & few_matches
+        rule3 = ~rule1 & ~rule2 & (self.build_count >= self._build_count_min) & full
+        rule4 = ~rule1 & ~rule2 & ~rule3 & few_matches & ((self.build_count == self._build_count_max) | full)
+        self.enable_scramble = enable | rule1 | rule2 | rule3 | rule4
+        self.max_rows = np.maximum(self.max_rows, row_count)
+
+    ### PLAY ###
+
+    def step(self):
+        # finished games (id -1) stay in the arrays until the next sort drops them
+        playing = self.ids >= 0
+        matching = playing & (self.grid_matches > 0)
+        done = playing & ~matching & (self.length == 0)
+        scrambling = playing & ~matching & ~done & self.enable_scramble
+        building = playing & ~matching & ~done & ~scrambling
+
+        # budgets are checked before every step as in Puzzle.play, an empty grid still finishes
+        over_steps, over_time = self.over_budget(playing, scrambling)
+        over = over_steps | over_time
+        matching &= ~over
+        scrambling &= ~over
+        building &= ~over
+
+        # a scramble also pays the step that ended the inner solve loop
+        self.steps += matching + building + (done & ~over) + 2 * scrambling
+        actions = np.select([matching, building, scrambling], [MATCH, BUILD, SCRAMBLE], 0)
+        self.match(matching)
+        self.build(building)
+        self.scramble(scrambling)
+        over_repeats = scrambling & (self._max_repeats is not None) & (self.repeats > (self._max_repeats or 0))
+        for games, status, limit in ((done, 'finished', None), (over_steps & ~done, 'unterminated', 'steps'),
+                                     (over_time & ~over_steps & ~done, 'unterminated', 'time'),
+                                     (over_repeats, 'unterminated', 'multiset_repeats')):
+            if games.any():
+                self.finish(games, status, limit)
+        self.ticks += 1
+        if self.ticks % SORT_TICKS == 0:
+            if len(self.ids) > CHUNK:
+                # sorted by length, each chunk of a rescan only scans as far as its longest grid
+                order = np.argsort(self.length, kind='stable')
+                order = order[self.ids[order] >= 0]
+            else:
+                order = np.flatnonzero(self.ids >= 0)
+            if len(order) < len(self.ids) or len(self.ids) > CHUNK:
+                for name in GAME_ARRAYS:
+                    setattr(self, name, getattr(self, name)[order])
+                actions = actions[order]
+                cols = self.columns(self.length)
+                if cols < self.values.shape[1] // 2:
+                    self.resize(cols)
+        self.cleanup(actions)
+
+    def over_budget(self, playing, scrambling):
+        # (over max_steps, over time_budget) of every game. a scramble takes two steps,
+        # the budget stops a game between them as it would stop Puzzle.play
+        over_steps = np.zeros(len(playing), dtype=bool)
+        if self._max_steps is not None:
+            over_steps = playing & (self.steps >= self._max_steps)
+            between = scrambling & ~over_steps & (self.steps + 1 >= self._max_steps)
+            self.steps += between
+            over_steps |= between
+        over_time = playing & (self._deadline is not None and perf_counter() >= self._deadline)
+        return over_steps, over_time
+
+    def finish(self, done, status='finished', limit=None):
+        runtime = perf_counter() - self._start
+        for row in np.flatnonzero(done):
+            self.results[int(self.ids[row])] = GameResult(
+                int(self.steps[row]),
+                int(self.max_rows[row]),
+                int(self.matches[row]),
+                int(self.builds[row]),
+                int(self.scrambles[row]),
+                self.score[row].item(),
+                {multi: int(self.multis[row, multi]) for multi in self._multiplier_population},
+                runtime,
+                status,
+                limit,
+                int(self.repeats[row]))
+        self.ids[done] = -1
+
+    def run(self, max_ticks=None, max_steps=None, time_budget=None, max_repeats=None):
+        # a GameResult per game, None for games still in play after max_ticks. max_steps,
+        # time_budget (seconds, counted from the start of the run) and max_repeats stop a
+        # game as in Puzzle.play
+        self._start = perf_counter()
+        self._max_steps = max_steps
+        self._max_repeats = max_repeats
+        self._deadline = None if time_budget is None else self._start + time_budget
+        while len(self.results) < self.games and (max_ticks is None or self.ticks < max_ticks):
+            self.step()
+        return [self.results.get(game) for game in range(self.games)]
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='play a batch of numzilla games in lockstep')
+    parser.add_argument('games', type=int)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--max-width', type=int, default=Defaults.max_width)
+    parser.add_argument('--num-start-rows', type=int, default=Defaults.num_start_rows)
+    parser.add_argument('--max-steps', type=int, default=None, help='steps before a game is stopped as unterminated')
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds before the games still in play are stopped as unterminated')
+    parser.add_argument('--max-repeats', type=int, default=None, help='scrambles dealing an earlier multiset of live values before a game is stopped')
+    args = parser.parse_args()
+
+    start = datetime.now()
+    results = Lockstep(args.games, args.max_width, args.num_start_rows, args.seed).run(
+        max_steps=args.max_steps, time_budget=args.time_budget, max_repeats=args.max_repeats)
+    end = (datetime.now() - start).total_seconds()
+    output('### LOCKSTEP: {0} GAMES IN {1:.2f}s ({2:.1f} GAMES/s)'.format(len(results), end, len(results) / end))
+    output('  MEAN SCORE: {0:.2f}'.format(sum(result.score for result in results) / len(results)))
+    output('  MEAN STEPS: {0:.2f}'.format(sum(result.steps for result in results) / len(results)))
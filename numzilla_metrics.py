@@ -0,0 +1,217 @@
+from argparse import ArgumentParser
+from collections import Counter
+from json import dumps
+from math import ceil, log
+from random import Random
+
+from numzilla import Puzzle, output
+from numzilla_batch import map_chunks
+
+### STREAMING METRICS ###
+#  summarises any number of games in constant memory. every field keeps its
+#  count, sum, sum of squares, min and max (whole numbers, so the sums are
+#  exact) and a sketch: counts of values in logarithmic buckets, each bucket
+#  spanning a factor of gamma, so any quantile read from it is within accuracy
+#  (relative) of the true one and the buckets double as a histogram. game
+#  fields are taken from each GameResult, step fields (with steps=True) from
+#  the puzzle after every solve step, as solve prints them with debug = -1.
+#  games stopped by a budget (see numzilla_batch) count as unterminated, by limit.
+#
+#  merging only adds counts and takes min / max, so summaries of disjoint sets
+#  of games merge to exactly the summary of all of them, in any order.
+
+GAME_FIELDS = ('score', 'steps', 'max_rows', 'matches', 'builds', 'scrambles')
+STEP_FIELDS = ('rows', 'nums', 'grid_matches', 'multiplier')
+ACCURACY = 0.01
+
+def new_stat():
+    return {'count': 0, 'sum': 0, 'sum_sq': 0, 'min': None, 'max': None, 'buckets': {}}
+
+
+class Metrics:
+
+    def __init__(self, accuracy=ACCURACY, steps=False):
+        self.accuracy = accuracy
+        self.steps = steps
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = log(self.gamma)
+        self.games = 0
+        self.stats = {} # field -> new_stat()
+        self.multipliers = Counter() # multipliers drawn, as in GameResult.multipliers
+        self.actions = Counter() # steps by action, with steps=True
+        self.unterminated = Counter() # games stopped by a budget, by limit
+
+    def add(self, result):
+        # one played game's GameResult
+        self.games += 1
+        if result.status == 'unterminated':
+            self.unterminated[result.limit] += 1
+        for field in GAME_FIELDS:
+            self.record(field, getattr(result, field))
+        self.multipliers.update(result.multipliers)
+
+    def on_step(self, puzzle, _step, action, _move):
+        # Puzzle.play(on_step=metrics.on_step) callback
+        self.actions[action] += 1
+        self.record('rows', puzzle.row_count)
+        self.record('nums', puzzle.num_count)
+        self.record('grid_matches', puzzle.grid_matches)
+        self.record('multiplier', puzzle.multiplier)
+
+    def bucket(self, value):
+        # 0 holds everything below 1, bucket k > 0 the values in (gamma ** (k - 2), gamma ** (k - 1)]
+        if value < 1:
+            return 0
+        return ceil(log(value) / self._log_gamma) + 1
+
+    def record(self, field, value):
+        stat = self.stats.get(field)
+        if stat is None:
+            stat = self.stats[field] = new_stat()
+        stat['count'] += 1
+        stat['sum'] += value
+        stat['sum_sq'] += value * value
+        if stat['min'] is None or value < stat['min']:
+            stat['min'] = value
+        if stat['max'] is None or value > stat['max']:
+            stat['max'] = value
+        bucket = self.bucket(value)
+        stat['buckets'][bucket] = stat['buckets'].get(bucket, 0) + 1
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError('cannot merge metrics kept at accuracy {0} and {1}'.format(self.accuracy, other.accuracy))
+        self.games += other.games
+        for field, other_stat in other.stats.items():
+            stat = self.stats.setdefault(field, new_stat())
+            stat['count'] += other_stat['count']
+            stat['sum'] += other_stat['sum']
+            stat['sum_sq'] += other_stat['sum_sq']
+            stat['min'] = other_stat['min'] if stat['min'] is None else min(stat['min'], other_stat['min'])
+            stat['max'] = other_stat['max'] if stat['max'] is None else max(stat['max'], other_stat['max'])
+            for bucket, count in other_stat['buckets'].items():
+                stat['buckets'][bucket] = stat['buckets'].get(bucket, 0) + count
+        self.multipliers.update(other.multipliers)
+        self.actions.update(other.actions)
+        self.unterminated.update(other.unterminated)
+        return self
+
+    ### SUMMARIES ###
+
+    def mean(self, field):
+        stat = self.stats[field]
+        return stat['sum'] / stat['count']
+
+    def std(self, field):
+        # sample standard deviation, from the exact sums
+        stat = self.stats[field]
+        if stat['count'] < 2:
+            return 0.0
+        return ((stat['count'] * stat['sum_sq'] - stat['sum'] ** 2) / (stat['count'] * (stat['count'] - 1))) ** 0.5
+
+    def representative(self, bucket):
+        if bucket == 0:
+            return 0
+        return 2 * self.gamma ** (bucket - 1) / (self.gamma + 1)
+
+    def quantile(self, field, q):
+        # the q quantile (0 to 1) within accuracy of the true one, clamped to the values seen
+        stat = self.stats[field]
+        rank = q * (stat['count'] - 1)
+        seen = 0
+        for bucket in sorted(stat['buckets']):
+            seen += stat['buckets'][bucket]
+            if seen > rank:
+                return min(max(self.representative(bucket), stat['min']), stat['max'])
+        return stat['max']
+
+    def histogram(self, field):
+        # (low, high, count) of every bucket holding values, low exclusive and high inclusive
+        out = []
+        for bucket, count in sorted(self.stats[field]['buckets'].items()):
+            if bucket == 0:
+                out.append((float('-inf'), 1, count))
+            else:
+                out.append((self.gamma ** (bucket - 2), self.gamma ** (bucket - 1), count))
+        return out
+
+    def as_dict(self):
+        return {'accuracy': self.accuracy, 'steps': self.steps, 'games': self.games,
+                'stats': self.stats, 'multipliers': dict(self.multipliers), 'actions': dict(self.actions),
+                'unterminated': dict(self.unterminated)}
+
+    @classmethod
+    def from_dict(cls, data):
+        # as_dict read back from json, where every integer key came back as a string
+        metrics = cls(data['accuracy'], data['steps'])
+        metrics.games = data['games']
+        for field, stat in data['stats'].items():
+            metrics.stats[field] = dict(stat, buckets={int(bucket): count for bucket, count in stat['buckets'].items()})
+        metrics.multipliers.update({int(multiplier): count for multiplier, count in data['multipliers'].items()})
+        metrics.actions.update(data['actions'])
+        metrics.unterminated.update(data.get('unterminated', {}))
+        return metrics
+
+    def to_json(self):
+        return dumps(self.as_dict())
+
+    def report(self):
+        out = ['### METRICS: {0} GAMES'.format(self.games)]
+        for field in GAME_FIELDS + STEP_FIELDS:
+            if field not in self.stats:
+                continue
+            if field == STEP_FIELDS[0]:
+                out.append('  PER STEP: {0}'.format(' | '.join('{0} {1}'.format(action, count) for action, count in sorted(self.actions.items()))))
+            stat = self.stats[field]
+            out.append('  {0:<12} MEAN {1:>10.2f} | STD {2:>9.2f} | P50 {3:>9.0f} | P90 {4:>9.0f} | P99 {5:>9.0f} | MIN {6:>7} | MAX {7:>7}'.format(
+                field.upper(), self.mean(field), self.std(field), self.quantile(field, 0.5), self.quantile(field, 0.9),
+                self.quantile(field, 0.99), stat['min'], stat['max']))
+        out.append('  MULTIPLIERS  {0}'.format(' | '.join('{0}: {1}'.format(multiplier, count) for multiplier, count in sorted(self.multipliers.items()))))
+        if self.unterminated:
+            out.append('  UNTERMINATED {0} | {1}'.format(sum(self.unterminated.values()), ' | '.join(
+                '{0} {1}'.format(limit.upper(), count) for limit, count in sorted(self.unterminated.items()))))
+        return '\n'.join(out)
+
+
+def play_metrics(seeds, puzzle_kwargs, limits=None, accuracy=ACCURACY, steps=False):
+    metrics = Metrics(accuracy, steps)
+    on_step = metrics.on_step if steps else None
+    for seed in seeds:
+        result = Puzzle(rng=Random(seed), **puzzle_kwargs).play(on_step=on_step, **(limits or {}))
+        if result.status == 'interrupted':
+            # as in numzilla_batch.play_games, ctrl+c stops the run rather than skewing it
+            raise KeyboardInterrupt
+        metrics.add(result)
+    return metrics
+
+def run_metrics(games, workers=None, seed=0, chunk_size=None, limits=None, accuracy=ACCURACY, steps=False, **puzzle_kwargs): # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # the Metrics of games seeded games played as numzilla_batch.run_batch plays them,
+    # each worker summarising its chunks and only the summaries crossing back
+    puzzle_kwargs.setdefault('debug', 0)
+    metrics = Metrics(accuracy, steps)
+    for chunk in map_chunks(play_metrics, games, workers, seed, chunk_size, (puzzle_kwargs, limits, accuracy, steps)):
+        metrics.merge(chunk)
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='play numzilla games and summarise them in constant memory')
+    parser.add_argument('games', type=int)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--steps', action='store_true', help='also summarise the grid after every step')
+    parser.add_argument('--accuracy', type=float, default=ACCURACY, help='relative accuracy of the quantiles')
+    parser.add_argument('--json', default=None, help='file to save the summary to')
+    parser.add_argument('--max-steps', type=int, default=None, help='steps before a game is stopped as unterminated')
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds before a game is stopped as unterminated')
+    parser.add_argument('--max-repeats', type=int, default=None, help='scrambles dealing an earlier multiset of live values before a game is stopped')
+    args = parser.parse_args()
+
+    play_limits = {key: val for key, val in (('max_steps', args.max_steps),
+                                             ('time_budget', args.time_budget),
+                                             ('max_repeats', args.max_repeats)) if val is not None}
+    summarised = run_metrics(args.games, args.workers, args.seed, limits=play_limits, accuracy=args.accuracy, steps=args.steps)
+    output(summarised.report())
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as dst:
+            dst.write(summarised.to_json())
@@ -0,0 +1,75 @@
+import numpy as np
+
+### NUMPY GRID BACKEND ###
+#  values are held in a compact int8 array and every bulk scan works on the
+#  live values compacted out of it, see numzilla_grid.ListGrid for the reference
+
+DTYPE = np.int8
+
+
+class NumpyGrid:
+
+    @staticmethod
+    def new(values):
+        return np.array(values, dtype=DTYPE)
+
+    @staticmethod
+    def live(values):
+        return values[values > 0]
+
+    @staticmethod
+    def live_count(values):
+        return int(np.count_nonzero(values > 0))
+
+    @staticmethod
+    def extend(values, tail):
+        return np.concatenate((values, tail))
+
+    @staticmethod
+    def truncate(values, length):
+        return values[:length]
+
+    @staticmethod
+    def find_pairs(values, max_width, sum_value, start=0):
+        # pairs whose second value is at or after start (see ListGrid.find_pairs), the
+        # live scan is vectorized over the whole grid and only the tail's pairs are kept
+        live = np.flatnonzero(values > 0)
+
+        # by index: each live value against the next live value
+        first, second = live[:-1], live[1:]
+        tail = second >= start
+        row_pairs = match_pairs(values, first[tail], second[tail], sum_value)
+
+        # by column: a stable sort on column keeps row order within each column
+        live = live[np.argsort(live % max_width, kind='stable')]
+        first, second = live[:-1], live[1:]
+        keep = ((first % max_width) == (second % max_width)) & (second >= start)
+        col_pairs = match_pairs(values, first[keep], second[keep], sum_value)
+        return row_pairs, col_pairs
+
+    @staticmethod
+    def has_pairs(values, max_width, sum_value):
+        # vectorized, so there's nothing to gain from stopping early
+        row_pairs, col_pairs = NumpyGrid.find_pairs(values, max_width, sum_value)
+        return bool(row_pairs or col_pairs)
+
+    @staticmethod
+    def row_counts(values, max_width):
+        rows = -(-len(values) // max_width)
+        live = np.zeros(rows * max_width, dtype=bool)
+        live[:len(values)] = values > 0
+        return live.reshape(rows, max_width).sum(axis=1).tolist()
+
+    @staticmethod
+    def remove_rows(values, rows, max_width):
+        keep = np.ones(len(values), dtype=bool)
+        for row_num in rows:
+            keep[row_num * max_width: (row_num + 1) * max_width] = False
+        return values[keep]
+
+
+def match_pairs(values, first, second, sum_value):
+    v1 = values[first].astype(np.int16)
+    v2 = values[second].astype(np.int16)
+    found = (v1 == v2) | (v1 + v2 == sum_value)
+    return dict(zip(first[found].tolist(), second[found].tolist()))
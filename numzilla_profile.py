@@ -0,0 +1,97 @@
+from argparse import ArgumentParser
+from json import dumps
+from random import Random
+from time import perf_counter
+
+from numzilla import Puzzle, output
+
+### PROFILING ###
+#  Puzzle(profile=Profile()) counts calls, cumulative wall time and the grid
+#  size (values, live or cleared) at call time of every @cleanup method and of
+#  the inner find_all, build_rows, build_columns and row_removal. times are
+#  inclusive, match_index includes the row_removal and build_rows it calls. one
+#  Profile can be shared by any number of puzzles.
+
+def new_stat():
+    return {'calls': 0, 'seconds': 0.0, 'cells': 0, 'max_cells': 0, 'by_cells': {}}
+
+
+class Profile:
+
+    def __init__(self):
+        self.stats = {} # name -> new_stat()
+
+    def call(self, name, puzzle, func, func_args, func_kwargs):
+        cells = len(puzzle.values)
+        start = perf_counter()
+        try:
+            return func(puzzle, *func_args, **func_kwargs)
+        finally:
+            self.record(name, cells, perf_counter() - start)
+
+    def record(self, name, cells, seconds):
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = new_stat()
+        stat['calls'] += 1
+        stat['seconds'] += seconds
+        stat['cells'] += cells
+        stat['max_cells'] = max(stat['max_cells'], cells)
+        # grid sizes bucketed by powers of two, keyed by the bucket's upper bound
+        bucket = stat['by_cells'].setdefault(1 << cells.bit_length(), [0, 0.0])
+        bucket[0] += 1
+        bucket[1] += seconds
+
+    def merge(self, other):
+        for name, other_stat in other.stats.items():
+            stat = self.stats.setdefault(name, new_stat())
+            stat['calls'] += other_stat['calls']
+            stat['seconds'] += other_stat['seconds']
+            stat['cells'] += other_stat['cells']
+            stat['max_cells'] = max(stat['max_cells'], other_stat['max_cells'])
+            for cells, (calls, seconds) in other_stat['by_cells'].items():
+                bucket = stat['by_cells'].setdefault(cells, [0, 0.0])
+                bucket[0] += calls
+                bucket[1] += seconds
+        return self
+
+    def as_dict(self):
+        return {name: {'calls': stat['calls'],
+                       'seconds': stat['seconds'],
+                       'mean_cells': stat['cells'] / stat['calls'],
+                       'max_cells': stat['max_cells'],
+                       'by_cells': {cells: {'calls': calls, 'seconds': seconds}
+                                    for cells, (calls, seconds) in sorted(stat['by_cells'].items())}}
+                for name, stat in self.stats.items()}
+
+    def to_json(self):
+        return dumps(self.as_dict(), indent=1)
+
+    def report(self):
+        out = ['### PROFILE']
+        for name, stat in sorted(self.stats.items(), key=lambda item: item[1]['seconds'], reverse=True):
+            out.append('  {0:<14} CALLS {1:>9} | SECONDS {2:>9.3f} | PER CALL {3:>9.2f}us | MEAN CELLS {4:>7.0f} | MAX CELLS {5:>6}'.format(
+                name, stat['calls'], stat['seconds'], 1e6 * stat['seconds'] / stat['calls'], stat['cells'] / stat['calls'], stat['max_cells']))
+        return '\n'.join(out)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='play numzilla games with profiling on and report where the time went')
+    parser.add_argument('games', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-width', type=int, default=None)
+    parser.add_argument('--num-start-rows', type=int, default=None)
+    parser.add_argument('--backend', default=None)
+    parser.add_argument('--json', default=None, help='file to save the stats to')
+    args = parser.parse_args()
+
+    kwargs = {key: val for key, val in (('max_width', args.max_width),
+                                        ('num_start_rows', args.num_start_rows),
+                                        ('backend', args.backend)) if val is not None}
+    profile = Profile()
+    for number in range(args.games):
+        Puzzle(rng=Random(args.seed + number), profile=profile, **kwargs).solve(silent=True)
+    output(profile.report())
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as dst:
+            dst.write(profile.to_json())
@@ -0,0 +1,107 @@
+import sys
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+
+from numzilla import Defaults, Puzzle, output
+
+### TERMINAL RENDERER ###
+#  draws Puzzle.frame after every operation of a Puzzle(renderer=...), each
+#  frame built in one buffer and written with a single call. in diff mode the
+#  first frame clears the screen and every later one only rewrites, through
+#  ansi cursor moves, the span of each line that changed since the last frame
+#  drawn. fps caps the frames drawn per second, operations in between are not
+#  drawn at all (the frame isn't even built), and close() draws the last one.
+
+CLEAR = '\x1b[2J\x1b[H'
+MOVE = '\x1b[{0};{1}H' # row, col (1 indexed)
+ERASE_LINE = '\x1b[K'
+ERASE_BELOW = '\x1b[J'
+
+
+class Renderer:
+
+    def __init__(self, stream=None, diff=False, fps=None):
+        self.stream = sys.stdout if stream is None else stream
+        self.diff = diff
+        self.interval = 0 if not fps else 1 / fps
+        self.frames = 0 # frames drawn
+        self.skipped = 0 # operations not drawn because of the frame rate cap
+        self._lines = None # the last frame drawn, in diff mode
+        self._last = None
+        self._pending = None # the puzzle of the last operation not drawn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def render(self, puzzle):
+        now = perf_counter()
+        if self._last is not None and now - self._last < self.interval:
+            self.skipped += 1
+            self._pending = puzzle
+            return
+        self._last = now
+        self._pending = None
+        self.draw(puzzle.frame())
+
+    def draw(self, lines):
+        if not self.diff:
+            self.stream.write('\n'.join(lines) + '\n')
+        else:
+            self.stream.write(self.changes(lines))
+            self._lines = lines
+        self.stream.flush()
+        self.frames += 1
+
+    def changes(self, lines):
+        # the escape sequences turning the last frame drawn into lines
+        if self._lines is None:
+            return CLEAR + '\n'.join(lines)
+        out = []
+        for row, line in enumerate(lines):
+            old = self._lines[row] if row < len(self._lines) else ''
+            if line == old:
+                continue
+            start = 0
+            while start < min(len(line), len(old)) and line[start] == old[start]:
+                start += 1
+            end = len(line)
+            if len(line) == len(old):
+                while end > start and line[end - 1] == old[end - 1]:
+                    end -= 1
+            out.append(MOVE.format(row + 1, start + 1) + line[start:end])
+            if len(line) < len(old):
+                out.append(ERASE_LINE)
+        if len(lines) < len(self._lines):
+            out.append(MOVE.format(len(lines) + 1, 1) + ERASE_BELOW)
+        return ''.join(out)
+
+    def close(self):
+        # draw the last operation if the cap skipped it, and leave the cursor below the frame
+        if self._pending is not None:
+            self._pending, puzzle = None, self._pending
+            self.draw(puzzle.frame())
+        if self.diff and self._lines is not None:
+            self.stream.write(MOVE.format(len(self._lines) + 1, 1))
+            self.stream.flush()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='watch a numzilla game solve in the terminal')
+    parser.add_argument('--width', type=int, default=Defaults.max_width)
+    parser.add_argument('--rows', type=int, default=Defaults.num_start_rows)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--diff', action='store_true', help='only redraw what changed since the last frame')
+    parser.add_argument('--fps', type=float, default=None, help='most frames drawn per second')
+    args = parser.parse_args()
+
+    with Renderer(diff=args.diff, fps=args.fps) as renderer:
+        game = Puzzle(debug=0, max_width=args.width, num_start_rows=args.rows, rng=Random(args.seed), renderer=renderer)
+        started = perf_counter()
+        result = game.solve(silent=True)
+        elapsed = perf_counter() - started
+    output('### RENDER: {0} STEPS IN {1:.2f}s | {2} FRAMES DRAWN | {3} SKIPPED | SCORE {4}'.format(
+        result.steps, elapsed, renderer.frames, renderer.skipped, result.score))
@@ -0,0 +1,163 @@
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from random import Random
+from time import perf_counter
+
+from numzilla import Puzzle, output
+from numzilla_batch import summary
+
+### LOOKAHEAD MOVE SEARCH ###
+#  selectors pick the next match, as (index, index), for Puzzle.play /
+#  Puzzle.solve(selector=...) by playing candidate matches out on the puzzle itself and ranking the
+#  states they reach. a state is worth the score gained on the way (which
+#  includes score_match's row bonus), plus extra weight for rows cleared by
+#  row_removal and for the grid value left behind. every line played is
+#  rolled back with Puzzle.snapshot / Puzzle.restore, so no copies are made.
+#
+#  node_budget caps the number of matches played per move and time_budget the
+#  seconds spent per move; whichever runs out first ends the search with the
+#  best move found so far.
+
+class Search(ABC):
+
+    def __init__(self, grid_weight=2.0, row_weight=10.0, node_budget=200, time_budget=None):
+        self.grid_weight = grid_weight
+        self.row_weight = row_weight
+        self.node_budget = node_budget
+        self.time_budget = time_budget
+        self.nodes = 0
+        self._deadline = None
+        self._root_score = 0
+
+    def __call__(self, puzzle):
+        self.nodes = 0
+        self._deadline = None if self.time_budget is None else perf_counter() + self.time_budget
+        self._root_score = puzzle.score
+        with rolled_back(puzzle) as mark:
+            return self.search(puzzle, mark)
+
+    @abstractmethod
+    def search(self, puzzle, root):
+        # the best move from puzzle, whose lines are rolled back to root
+        pass
+
+    def exhausted(self):
+        if self.node_budget is not None and self.nodes >= self.node_budget:
+            return True
+        return self._deadline is not None and perf_counter() >= self._deadline
+
+    def branch(self, puzzle, move):
+        # play move and return the number of rows it cleared
+        self.nodes += 1
+        row_count = puzzle.row_count
+        puzzle.match_index(*move)
+        return row_count - puzzle.row_count
+
+    def evaluate(self, puzzle, rows_cleared):
+        gained = puzzle.score - self._root_score
+        return gained + puzzle.multiplier * (self.row_weight * rows_cleared + self.grid_weight * puzzle.grid_value)
+
+
+@contextmanager
+def rolled_back(puzzle):
+    # lines played on puzzle inside are silent, not drawn and all undone on the way out
+    debug, puzzle.debug = puzzle.debug, 0
+    renderer, puzzle.renderer = puzzle.renderer, None
+    mark = puzzle.snapshot()
+    try:
+        yield mark
+    finally:
+        puzzle.restore(mark)
+        if mark == 0:
+            puzzle.forget()
+        puzzle.debug = debug
+        puzzle.renderer = renderer
+
+def candidates(puzzle):
+    # the same pair can be found both by index and by column
+    return list(dict.fromkeys(puzzle.index_matches))
+
+
+class BeamSearch(Search):
+
+    def __init__(self, depth=3, width=4, **kwargs):
+        super().__init__(**kwargs)
+        self.depth = depth
+        self.width = width
+
+    def search(self, puzzle, root):
+        moves = candidates(puzzle)
+        best = (None, moves[0])
+        beam = [(0, moves[0], (), 0)] # (value, first move, line from the root, rows cleared)
+        for depth in range(self.depth):
+            expanded = []
+            for _, first, line, rows_cleared in beam:
+                # replay the line, then try each follow up from there
+                puzzle.restore(root)
+                for move in line:
+                    puzzle.match_index(*move)
+                state = puzzle.snapshot()
+                for move in candidates(puzzle):
+                    if self.exhausted():
+                        break
+                    cleared = rows_cleared + self.branch(puzzle, move)
+                    expanded.append((self.evaluate(puzzle, cleared), move if depth == 0 else first, line + (move,), cleared))
+                    puzzle.restore(state)
+            if not expanded:
+                break
+            expanded.sort(key=lambda node: node[0], reverse=True)
+            beam = expanded[:self.width]
+            best = beam[0][:2]
+            if self.exhausted():
+                break
+        return best[1]
+
+
+class MonteCarloSearch(Search):
+
+    def __init__(self, depth=6, rollouts=8, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.depth = depth
+        self.rollouts = rollouts
+        self.random = Random(seed) # rollouts don't touch the game's own random state
+
+    def search(self, puzzle, root):
+        moves = candidates(puzzle)
+        totals = {move: [0, 0] for move in moves}
+        for _ in range(self.rollouts):
+            for move in moves:
+                if self.exhausted():
+                    break
+                totals[move][0] += self.rollout(puzzle, move)
+                totals[move][1] += 1
+                puzzle.restore(root)
+        return max(moves, key=lambda move: totals[move][0] / totals[move][1] if totals[move][1] else float('-inf'))
+
+    def rollout(self, puzzle, move):
+        cleared = self.branch(puzzle, move)
+        for _ in range(self.depth - 1):
+            if puzzle.grid_matches == 0:
+                break
+            cleared += self.branch(puzzle, self.random.choice(puzzle.index_matches))
+        return self.evaluate(puzzle, cleared)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='play numzilla games picking matches by lookahead search')
+    parser.add_argument('games', type=int)
+    parser.add_argument('--search', choices=['beam', 'monte-carlo', 'random'], default='beam')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--nodes', type=int, default=200)
+    parser.add_argument('--time', type=float, default=None)
+    args = parser.parse_args()
+
+    selector = None
+    if args.search == 'beam':
+        selector = BeamSearch(node_budget=args.nodes, time_budget=args.time)
+    elif args.search == 'monte-carlo':
+        selector = MonteCarloSearch(node_budget=args.nodes, time_budget=args.time, seed=args.seed)
+    results = []
+    for game in range(args.games):
+        results.append(Puzzle(rng=Random(args.seed + game)).solve(silent=True, selector=selector))
+    output(summary(results))
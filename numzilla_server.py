@@ -0,0 +1,346 @@
+import asyncio
+from contextlib import suppress
+from argparse import ArgumentParser
+from collections import OrderedDict
+from json import dumps, loads
+from random import Random
+from secrets import token_hex
+from statistics import quantiles
+from time import monotonic, perf_counter
+
+from numzilla import CONFIG, Defaults, Puzzle, output
+
+### GAME SESSION SERVER ###
+#  hosts Puzzle sessions over a local tcp or unix socket. the protocol is one
+#  json object per line each way. every request carries an "op" (plus "id",
+#  echoed back, and "session" for everything but "new"), every response has
+#  "ok" and either the result fields or an "error".
+#
+#  new       {max_width, num_start_rows, seed, backend, config} -> session, state
+#  match     {m1: [col, row], m2: [col, row]}                  -> summary
+#  build     (when puzzle.enable_build or no match is left)     -> summary
+#  scramble  (when puzzle.enable_scramble)                      -> summary
+#  state                                                        -> state (with the grid)
+#  hint      {limit}                                            -> hints (best first, see Puzzle.hints)
+#  close
+#
+#  moves, state and hints on grids of OFFLOAD_CELLS or more run on a thread
+#  pool so they don't stall the event loop, smaller ones run inline (a thread
+#  hop costs more than they do). new sessions follow the same rule by their
+#  starting grid, which is capped at MAX_WIDTH values a row and MAX_CELLS
+#  values, and their config is checked against Defaults. a lock per session
+#  keeps requests for one session (from any connection) in order. sessions
+#  idle for idle_timeout seconds are evicted, as is the least recently used
+#  one when max_sessions is reached.
+
+MOVES = ('match', 'build', 'scramble')
+GRID_OPS = MOVES + ('state', 'hint')
+OFFLOAD_CELLS = 2000
+MAX_WIDTH = 100
+MAX_CELLS = 100000
+
+
+class Session:
+
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+        self.lock = asyncio.Lock()
+        self.used = monotonic()
+
+
+def summary(puzzle):
+    return {'score': puzzle.score, 'multiplier': puzzle.multiplier, 'grid_matches': puzzle.grid_matches,
+            'row_count': puzzle.row_count, 'num_count': puzzle.num_count, 'enable_build': puzzle.enable_build,
+            'enable_scramble': puzzle.enable_scramble, 'finished': len(puzzle.values) == 0}
+
+def state(puzzle):
+    return dict(summary(puzzle), rows=[[int(val) for val in row] for row in puzzle.build_rows()])
+
+def live_index(puzzle, move):
+    col, row = move
+    index = puzzle.index_from_col_row(col, row)
+    # the round trip only holds for a column within the grid width
+    if not (0 <= index < len(puzzle.values) and puzzle.col_row_from_index(index) == (col, row) and puzzle.values[index] > 0):
+        raise ValueError('{0} is not a live value'.format(move))
+    return index
+
+def check_config(config):
+    # raises ValueError on a config Puzzle would take but play badly with: every value
+    # has the type of its default, is in range, and the multiplier tables fit together
+    if not isinstance(config, dict):
+        raise ValueError('config must be an object')
+    for key, val in config.items():
+        if key not in CONFIG:
+            raise ValueError('unknown config {0}'.format(key))
+        default = getattr(Defaults, key)
+        if isinstance(default, bool):
+            valid = isinstance(val, bool)
+        elif isinstance(default, list):
+            valid = isinstance(val, list) and all(isinstance(item, (int, float)) and not isinstance(item, bool) and item >= 0 for item in val)
+        else:
+            kinds = int if isinstance(default, int) else (int, float)
+            valid = isinstance(val, kinds) and not isinstance(val, bool) and 0 <= val < float('inf')
+        if not valid:
+            kind = 'true or false' if isinstance(default, bool) else 'numbers of at least 0' if isinstance(default, list) else 'a number of at least 0'
+            raise ValueError('config {0} takes {1} like {2}'.format(key, kind, dumps(default)))
+    settings = {key: config.get(key, getattr(Defaults, key)) for key in CONFIG}
+    if not 2 <= settings['sum_value'] <= 18:
+        raise ValueError('config sum_value takes 2 to 18')
+    if settings['build_count_min'] > settings['build_count_max']:
+        raise ValueError('config build_count_min is over build_count_max')
+    population = settings['multiplier_population']
+    if len(set(population)) != len(population) or len(population) < 2 or not all(isinstance(multi, int) and 1 <= multi <= 255 for multi in population):
+        raise ValueError('config multiplier_population takes 2 or more different whole numbers from 1 to 255')
+    if settings['multiplier'] not in population:
+        raise ValueError('config multiplier is not in multiplier_population')
+    for key in ('multipliers_weights_current_low', 'multipliers_weights_current_high'):
+        if len(settings[key]) != len(population) - 1 or sum(settings[key]) <= 0:
+            raise ValueError('config {0} takes a weight for every multiplier but the current one'.format(key))
+
+def new_puzzle(kwargs):
+    # (puzzle, its state), the grid is dealt and listed in one go, off the event loop for large ones
+    puzzle = Puzzle(debug=0, **kwargs)
+    return puzzle, state(puzzle)
+
+def play_move(puzzle, request):
+    op = request['op']
+    if op == 'match':
+        m1, m2 = tuple(request['m1']), tuple(request['m2'])
+        i1, i2 = live_index(puzzle, m1), live_index(puzzle, m2)
+        if not puzzle.is_match(puzzle.values[i1], puzzle.values[i2]):
+            raise ValueError('{0} and {1} are not a match'.format(m1, m2))
+        puzzle.match_index(i1, i2)
+    elif op == 'build':
+        if not (puzzle.enable_build or puzzle.grid_matches == 0) or len(puzzle.values) == 0:
+            raise ValueError('build is not available')
+        puzzle.build()
+    else:
+        if not puzzle.enable_scramble:
+            raise ValueError('scramble is not available')
+        puzzle.scramble()
+    return summary(puzzle)
+
+def grid_op(puzzle, request):
+    # a move, state or hint, any of which walks the grid
+    op = request['op']
+    if op in MOVES:
+        return play_move(puzzle, request)
+    if op == 'state':
+        return state(puzzle)
+    limit = request.get('limit', 1)
+    if not (isinstance(limit, int) and limit >= 1):
+        raise ValueError('limit takes a whole number of at least 1')
+    return {'hints': [hint._asdict() for hint in puzzle.hints(limit)]}
+
+
+class GameServer:
+
+    def __init__(self, idle_timeout=300, max_sessions=10000):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict() # least recently used first
+        self._server = None
+        self._evictor = None
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        if path is None:
+            self._server = await asyncio.start_server(self.handle, host, port)
+        else:
+            self._server = await asyncio.start_unix_server(self.handle, path)
+        self._evictor = asyncio.ensure_future(self.evict_idle())
+        return self._server
+
+    @property
+    def address(self):
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def stop(self):
+        self._evictor.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._evictor
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def evict_idle(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 0.01))
+            cutoff = monotonic() - self.idle_timeout
+            for session_id, session in list(self.sessions.items()):
+                if session.used >= cutoff:
+                    break # the rest were used more recently
+                if not session.lock.locked():
+                    del self.sessions[session_id]
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(dumps(await self.respond(line)).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line):
+        request = {}
+        try:
+            request = loads(line)
+            response = await self.dispatch(request)
+            response['ok'] = True
+        except (ValueError, KeyError, TypeError, IndexError) as error:
+            response = {'ok': False, 'error': str(error) if not isinstance(error, KeyError) else 'missing {0}'.format(error)}
+        if isinstance(request, dict) and 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def dispatch(self, request):
+        op = request['op']
+        if op == 'new':
+            return await self.new_session(request)
+
+        session_id = request['session']
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise ValueError('no session {0}'.format(session_id))
+        self.sessions.move_to_end(session_id)
+        session.used = monotonic()
+        async with session.lock:
+            if op in GRID_OPS and len(session.puzzle.values) >= OFFLOAD_CELLS:
+                return await asyncio.get_running_loop().run_in_executor(None, grid_op, session.puzzle, request)
+            if op in GRID_OPS:
+                return grid_op(session.puzzle, request)
+            if op == 'close':
+                self.sessions.pop(session_id, None)
+                return {}
+        raise ValueError('unknown op {0}'.format(op))
+
+    async def new_session(self, request):
+        kwargs = {key: request[key] for key in ('max_width', 'num_start_rows', 'backend', 'config') if key in request}
+        width = kwargs.setdefault('max_width', Defaults.max_width)
+        rows = kwargs.setdefault('num_start_rows', Defaults.num_start_rows)
+        if not (isinstance(width, int) and isinstance(rows, int) and 1 <= width <= MAX_WIDTH and 1 <= rows and width * rows <= MAX_CELLS):
+            raise ValueError('a new grid takes 1 to {0} values a row and {1} values at most'.format(MAX_WIDTH, MAX_CELLS))
+        if 'config' in kwargs:
+            check_config(kwargs['config'])
+        if 'seed' in request:
+            kwargs['rng'] = Random(request['seed'])
+        if width * rows >= OFFLOAD_CELLS:
+            puzzle, created = await asyncio.get_running_loop().run_in_executor(None, new_puzzle, kwargs)
+        else:
+            puzzle, created = new_puzzle(kwargs)
+        while len(self.sessions) >= self.max_sessions:
+            self.sessions.popitem(last=False)
+        session_id = token_hex(8)
+        self.sessions[session_id] = Session(puzzle)
+        return {'session': session_id, 'state': created}
+
+
+### LOAD GENERATOR ###
+#  plays games against a server, one connection per simulated player, always
+#  taking the best hint, and times every move request (match, build, scramble)
+
+async def call(reader, writer, request):
+    writer.write(dumps(request).encode() + b'\n')
+    await writer.drain()
+    response = loads(await reader.readline())
+    if not response['ok']:
+        raise ValueError(response['error'])
+    return response
+
+async def player(connect, seed, moves, latencies):
+    reader, writer = await connect()
+    try:
+        response = await call(reader, writer, {'op': 'new', 'seed': seed})
+        session_id = response['session']
+        status = response['state']
+        for _ in range(moves):
+            if status['finished']:
+                break
+            if status['grid_matches'] > 0:
+                hint = (await call(reader, writer, {'op': 'hint', 'session': session_id}))['hints'][0]
+                request = {'op': 'match', 'session': session_id, 'm1': hint['m1'], 'm2': hint['m2']}
+            elif status['enable_scramble']:
+                request = {'op': 'scramble', 'session': session_id}
+            else:
+                request = {'op': 'build', 'session': session_id}
+            start = perf_counter()
+            status = await call(reader, writer, request)
+            latencies.append(perf_counter() - start)
+        await call(reader, writer, {'op': 'close', 'session': session_id})
+    finally:
+        writer.close()
+
+async def run_load(connect, players=100, moves=200, seed=0, concurrency=None):
+    # (move latencies in seconds, total seconds) for players games of up to moves moves,
+    # at most concurrency of them connected at once (all of them by default)
+    latencies = []
+    limit = asyncio.Semaphore(concurrency or players)
+
+    async def limited(number):
+        async with limit:
+            await player(connect, seed + number, moves, latencies)
+
+    start = perf_counter()
+    await asyncio.gather(*(limited(number) for number in range(players)))
+    return latencies, perf_counter() - start
+
+def load_report(latencies, elapsed):
+    # percentiles take two or more timed moves, n/a below that
+    cuts = quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else None
+    timed = [None, None] if cuts is None else [cuts[49], cuts[98]]
+    timed.append(max(latencies, default=None))
+    return '### LOAD: {0} MOVES IN {1:.2f}s | {2:.0f} MOVES/S | P50 {3} | P99 {4} | MAX {5}'.format(
+        len(latencies), elapsed, len(latencies) / elapsed, *('n/a' if seconds is None else '{0:.2f}ms'.format(1e3 * seconds) for seconds in timed))
+
+def connector(host='127.0.0.1', port=None, path=None):
+    # opens client connections, responses carrying a whole grid can be long lines
+    if path is None:
+        return lambda: asyncio.open_connection(host, port, limit=1 << 22)
+    return lambda: asyncio.open_unix_connection(path, limit=1 << 22)
+
+async def serve(args):
+    server = GameServer(args.idle, args.max_sessions)
+    await server.start(args.host, args.port, args.unix)
+    output('### SERVING ON {0}'.format(server.address))
+    await server.serve_forever()
+
+async def load(args):
+    server = None
+    host, port, path = args.host, args.port, args.unix
+    if args.local:
+        server = GameServer()
+        if path is None:
+            await server.start(host, 0)
+            host, port = server.address[:2]
+        else:
+            await server.start(path=path)
+    try:
+        output(load_report(*await run_load(connector(host, port, path), args.players, args.moves, args.seed, args.concurrency)))
+    finally:
+        if server is not None:
+            await server.stop()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='serve numzilla game sessions over a local socket, or load test a server')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, text in (('serve', 'run the session server'), ('load', 'play games against a server and report move latency')):
+        command = commands.add_parser(name, help=text)
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=8765)
+        command.add_argument('--unix', default=None, help='unix socket path to use instead of tcp')
+    commands.choices['serve'].add_argument('--idle', type=float, default=300, help='seconds before an idle session is evicted')
+    commands.choices['serve'].add_argument('--max-sessions', type=int, default=10000)
+    commands.choices['load'].add_argument('--players', type=int, default=100)
+    commands.choices['load'].add_argument('--moves', type=int, default=200, help='moves per player at most')
+    commands.choices['load'].add_argument('--concurrency', type=int, default=None)
+    commands.choices['load'].add_argument('--seed', type=int, default=0)
+    commands.choices['load'].add_argument('--local', action='store_true', help='start a server in this process to test against')
+    cli_args = parser.parse_args()
+    asyncio.run(serve(cli_args) if cli_args.command == 'serve' else load(cli_args))
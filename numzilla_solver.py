@@ -0,0 +1,172 @@
+from argparse import ArgumentParser
+from collections import OrderedDict, namedtuple
+from random import Random
+from time import perf_counter
+
+from numzilla import Puzzle, output
+from numzilla_search import candidates, rolled_back
+
+### EXACT SOLVER ###
+#  plays every line of matches and builds from a puzzle's current state and
+#  returns the best score that can still be gained and the fewest builds that
+#  clear the grid. the moves are the game's: any match, and a build when
+#  enable_build is set or (as in Puzzle.play) when no match is left and scramble
+#  isn't enabled. a scramble deals at random, so a state that needs one is a
+#  leaf: its line ends there and doesn't clear the grid.
+#
+#  states reached by more than one line are solved once, through a table keyed
+#  by a zobrist hash: a random 64 bit number per (index, value) xored over the
+#  grid (every used value counted as 0, they are all gaps alike), plus numbers
+#  for the multiplier, build count and run of consecutive builds, which decide
+#  what the state can still score and when build and scramble turn on. a match
+#  updates the hash with 4 xors, a build with one per value added, only a row
+#  removal rehashes the grid. the table keeps table_size entries at most, least
+#  recently used evicted first.
+#
+#  builds double the live values, so the number of states grows steeply with
+#  every build allowed: max_builds caps the builds a line may make (the result
+#  is then exact for lines of at most that many), node_budget (states visited)
+#  and time_budget (seconds) stop a search early, in which case the result is
+#  the best found so far and exact is False.
+
+ExactResult = namedtuple('ExactResult', ['score', 'builds', 'exact', 'nodes', 'seconds', 'probes', 'hits', 'evictions'])
+
+
+class ExactSolver:
+
+    def __init__(self, max_builds=None, table_size=1000000, node_budget=None, time_budget=None, seed=0):
+        self.max_builds = max_builds
+        self.table_size = table_size
+        self.node_budget = node_budget
+        self.time_budget = time_budget
+        self.table = OrderedDict() # hash -> (score, builds), least recently used first
+        self.nodes = 0
+        self.probes = 0
+        self.hits = 0
+        self.evictions = 0
+        self.exact = True
+        self._random = Random(seed)
+        self._keys = {}
+        self._deadline = None
+        self._build_limit = None
+
+    def __call__(self, puzzle):
+        # the ExactResult of puzzle's current state, which is left as it was.
+        # builds is None when no line clears the grid without a scramble
+        self.nodes = self.probes = self.hits = self.evictions = 0
+        self.exact = True
+        self._deadline = None if self.time_budget is None else perf_counter() + self.time_budget
+        self._build_limit = None if self.max_builds is None else puzzle.build_count + self.max_builds
+        self.table.clear() # entries only hold for one build limit, board width and config
+        start = perf_counter()
+        with rolled_back(puzzle):
+            score, builds = self.solve(puzzle, self.grid_key(puzzle))
+        return ExactResult(score, builds, self.exact, self.nodes, perf_counter() - start, self.probes, self.hits, self.evictions)
+
+    ### HASHING ###
+
+    def key(self, *term):
+        # the random number for a term, (index, value) for the grid
+        number = self._keys.get(term)
+        if number is None:
+            number = self._keys[term] = self._random.getrandbits(64)
+        return number
+
+    def cell_key(self, index, val):
+        return self.key(index, val if val > 0 else 0)
+
+    def grid_key(self, puzzle):
+        grid = 0
+        for index, val in enumerate(puzzle.values):
+            grid ^= self.cell_key(index, val)
+        return grid
+
+    def state_key(self, puzzle, grid):
+        return grid ^ self.key('multiplier', puzzle.multiplier) ^ self.key('builds', puzzle.build_count) ^ self.key('in a row', puzzle.builds_in_a_row)
+
+    ### SEARCH ###
+
+    def exhausted(self):
+        if self.node_budget is not None and self.nodes >= self.node_budget:
+            return True
+        return self._deadline is not None and perf_counter() >= self._deadline
+
+    def solve(self, puzzle, grid):
+        # (best score gained from here, fewest builds to clear the grid or None)
+        self.nodes += 1
+        if len(puzzle.values) == 0:
+            return 0, 0
+        key = self.state_key(puzzle, grid)
+        self.probes += 1
+        entry = self.table.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.table.move_to_end(key)
+            return entry
+        if self.exhausted():
+            self.exact = False
+            return 0, None
+
+        best, fewest = 0, None
+        mark = puzzle.snapshot()
+        for i1, i2 in candidates(puzzle):
+            score, row_count = puzzle.score, puzzle.row_count
+            v1, v2 = puzzle.values[i1], puzzle.values[i2]
+            puzzle.match_index(i1, i2)
+            if puzzle.row_count == row_count:
+                child = grid ^ self.cell_key(i1, v1) ^ self.cell_key(i1, 0) ^ self.cell_key(i2, v2) ^ self.cell_key(i2, 0)
+            else:
+                child = self.grid_key(puzzle)
+            gained = puzzle.score - score
+            child_best, child_fewest = self.solve(puzzle, child)
+            puzzle.restore(mark)
+            best = max(best, gained + child_best)
+            if child_fewest is not None and (fewest is None or child_fewest < fewest):
+                fewest = child_fewest
+
+        can_build = puzzle.enable_build or (puzzle.grid_matches == 0 and not puzzle.enable_scramble)
+        if can_build and (self._build_limit is None or puzzle.build_count < self._build_limit):
+            start = len(puzzle.values)
+            puzzle.build()
+            child = grid
+            for index in range(start, len(puzzle.values)):
+                child ^= self.cell_key(index, puzzle.values[index])
+            child_best, child_fewest = self.solve(puzzle, child)
+            puzzle.restore(mark)
+            best = max(best, child_best)
+            if child_fewest is not None and (fewest is None or child_fewest + 1 < fewest):
+                fewest = child_fewest + 1
+
+        # a search cut short leaves the states it was in unsolved
+        if self.exact:
+            self.table[key] = (best, fewest)
+            if len(self.table) > self.table_size:
+                self.table.popitem(last=False)
+                self.evictions += 1
+        return best, fewest
+
+
+def report(result, seed=None):
+    seconds = max(result.seconds, 1e-9)
+    return '### EXACT{0}: SCORE {1}{2} | FEWEST BUILDS {3} | {4} NODES IN {5:.2f}s | {6:.0f} NODES/S | TABLE HITS {7:.1%} | {8} EVICTIONS'.format(
+        '' if seed is None else ' (SEED {0})'.format(seed), result.score, '' if result.exact else ' (NOT EXACT)',
+        '-' if result.builds is None else result.builds, result.nodes, result.seconds, result.nodes / seconds,
+        result.hits / result.probes if result.probes else 0, result.evictions)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='solve small numzilla boards exactly, up to the first scramble')
+    parser.add_argument('--width', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--games', type=int, default=1)
+    parser.add_argument('--max-builds', type=int, default=2, help='most builds in a line searched (-1 for the game\'s own limit)')
+    parser.add_argument('--table', type=int, default=1000000, help='most transposition table entries kept')
+    parser.add_argument('--nodes', type=int, default=None)
+    parser.add_argument('--time', type=float, default=None)
+    args = parser.parse_args()
+
+    solver = ExactSolver(None if args.max_builds < 0 else args.max_builds, args.table, args.nodes, args.time)
+    for game in range(args.games):
+        board = Puzzle(debug=0, max_width=args.width, num_start_rows=args.rows, rng=Random(args.seed + game))
+        output(report(solver(board), args.seed + game))
@@ -0,0 +1,115 @@
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from hashlib import sha256
+from itertools import product
+from json import dumps
+from random import Random
+from statistics import mean
+
+from numzilla import CONFIG, output
+from numzilla_batch import load_result, play_games, read_json, write_json
+
+### PARAMETER SWEEPS ###
+#  plays a seeded batch of games for every config in a search space over the
+#  Defaults listed in numzilla.CONFIG. a space maps each name to a list of
+#  values and a grid sweep tries every combination. a random sweep draws each
+#  value from its list instead, or uniformly from a {'min': low, 'max': high}
+#  range (ints stay ints).
+#
+#  with a cache directory every game is stored under a hash of its config and
+#  puzzle options, keyed by seed, so rerunning or extending a sweep (more
+#  configs, more games) only plays what's missing. the backend isn't part of
+#  the hash since every backend plays the same games.
+
+def grid_configs(space):
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in product(*(space[name] for name in names))]
+
+def random_configs(space, samples, seed=0):
+    rng = Random(seed)
+    configs = []
+    for _ in range(samples):
+        config = {}
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, dict):
+                if isinstance(values['min'], int) and isinstance(values['max'], int):
+                    config[name] = rng.randint(values['min'], values['max'])
+                else:
+                    config[name] = rng.uniform(values['min'], values['max'])
+            else:
+                config[name] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+def config_key(config, puzzle_kwargs):
+    options = {key: val for key, val in puzzle_kwargs.items() if key not in ('debug', 'backend')}
+    return sha256(dumps([config, options], sort_keys=True).encode()).hexdigest()[:20]
+
+def play_config(number, config, seeds, puzzle_kwargs):
+    return number, seeds, play_games(seeds, dict(puzzle_kwargs, config=config))
+
+def run_sweep(configs, games, seed=0, workers=None, cache=None, chunk_size=50, **puzzle_kwargs): # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # [(config, [GameResult per seed])] in the order of configs
+    unknown = sorted({name for config in configs for name in config if name not in CONFIG})
+    if unknown:
+        raise ValueError('unknown config {0}'.format(', '.join(unknown)))
+    workers = workers or os.cpu_count() or 1
+    puzzle_kwargs.setdefault('debug', 0)
+    seeds = range(seed, seed + games)
+
+    stored = []
+    tasks = []
+    for number, config in enumerate(configs):
+        path = None if cache is None else os.path.join(cache, config_key(config, puzzle_kwargs) + '.json')
+        results = read_json(path)['results'] if path is not None and os.path.exists(path) else {}
+        stored.append((path, results))
+        missing = [_seed for _seed in seeds if str(_seed) not in results]
+        tasks += [(number, config, missing[i: i + chunk_size]) for i in range(0, len(missing), chunk_size)]
+    if cache is not None:
+        os.makedirs(cache, exist_ok=True)
+
+    def store(number, played_seeds, played):
+        path, results = stored[number]
+        for _seed, result in zip(played_seeds, played):
+            results[str(_seed)] = list(result)
+        if path is not None:
+            write_json(path, {'config': configs[number], 'results': results})
+
+    if workers == 1:
+        for task in tasks:
+            store(*play_config(*task, puzzle_kwargs))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            for future in as_completed([pool.submit(play_config, *task, puzzle_kwargs) for task in tasks]):
+                store(*future.result())
+    return [(config, [load_result(list(results[str(_seed)])) for _seed in seeds]) for config, (_, results) in zip(configs, stored)]
+
+def report(sweep, key='score'):
+    out = ['### SWEEP: {0} CONFIGS, RANKED BY MEAN {1}'.format(len(sweep), key.upper())]
+    ranked = sorted(sweep, key=lambda point: mean(getattr(result, key) for result in point[1]), reverse=True)
+    for config, results in ranked:
+        out.append('  SCORE {0:>10.1f} | STEPS {1:>8.1f} | SCRAMBLES {2:>6.2f} | {3}'.format(
+            mean(result.score for result in results), mean(result.steps for result in results),
+            mean(result.scrambles for result in results), dumps(config, sort_keys=True)))
+    return '\n'.join(out)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='play seeded batches of numzilla games over a space of Defaults')
+    parser.add_argument('space', help='json file mapping Defaults names to lists of values (or {"min", "max"} ranges for --samples)')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--samples', type=int, default=None, help='draw this many random configs instead of sweeping the full grid')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache', default=None, help='directory to cache played games in')
+    parser.add_argument('--rank', default='score', choices=['score', 'steps', 'matches', 'builds', 'scrambles', 'max_rows'])
+    args = parser.parse_args()
+
+    search_space = read_json(args.space)
+    if args.samples is None:
+        sweep_configs = grid_configs(search_space)
+    else:
+        sweep_configs = random_configs(search_space, args.samples, args.seed)
+    output(report(run_sweep(sweep_configs, args.games, args.seed, args.workers, args.cache), args.rank))
@@ -0,0 +1,231 @@
+from argparse import ArgumentParser
+from collections import namedtuple
+from json import dumps, loads
+from mmap import mmap, ACCESS_READ
+from random import Random
+from struct import Struct, calcsize
+
+from numzilla import Defaults, Puzzle, output
+from numzilla_batch import summary
+
+### GAME TRACES ###
+#  a trace file holds any number of played games in a fixed little-endian
+#  layout, so millions of games can be kept and re-read without text parsing
+#
+#  file:  MAGIC, then one record per game
+#  game:  header (GAME), config (config bytes of json, the Puzzle config the game
+#         was played with, none for the defaults), starting grid (grid bytes, one
+#         per value), moves
+#  moves: MATCH    op, first index, second index (flat indices before the match)
+#         BUILD    op
+#         SCRAMBLE op, new multiplier, grid length, grid bytes (the grid it dealt)
+#
+#  the header holds the record length and the GameResult totals, so aggregate
+#  fields can be read straight from the mapped file without decoding any moves.
+#  status and limit are stored as their position in STATUSES and LIMITS. sizes
+#  and indices are 32 bit, so any grid a Puzzle can hold in memory fits
+
+MAGIC = b'NZTRACE3'
+
+GAME_FIELDS = (('length', 'I'), ('seed', 'q'), ('max_width', 'I'), ('num_start_rows', 'I'),
+               ('config', 'I'), ('grid', 'I'), ('steps', 'I'), ('max_rows', 'I'), ('matches', 'I'),
+               ('builds', 'I'), ('scrambles', 'I'), ('score', 'q'), ('status', 'B'), ('limit', 'B'), ('repeats', 'I'))
+GAME = Struct('<' + ''.join(code for _, code in GAME_FIELDS))
+GameHeader = namedtuple('GameHeader', [name for name, _ in GAME_FIELDS])
+# offset and format of every header field, for reading one field of every game
+FIELDS = {name: (calcsize('<' + ''.join(code for _, code in GAME_FIELDS[:num])), '<' + code)
+          for num, (name, code) in enumerate(GAME_FIELDS)}
+
+OP_MATCH = 0
+OP_BUILD = 1
+OP_SCRAMBLE = 2
+MATCH = Struct('<BII')
+SCRAMBLE = Struct('<BHI')
+
+# GameResult.status and limit values, see Puzzle.play
+STATUSES = ('finished', 'partial', 'interrupted', 'unterminated')
+LIMITS = (None, 'steps', 'time', 'multiset_repeats')
+
+Move = namedtuple('Move', ['action', 'indices', 'multiplier', 'values'])
+
+
+class TraceWriter:
+
+    def __init__(self, path):
+        self._file = open(path, 'wb') # pylint: disable=consider-using-with
+        self._file.write(MAGIC)
+        self.games = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def record(self, seed, selector=None, limits=None, **puzzle_kwargs):
+        # plays one game from its own Random(seed) and appends it to the trace. limits are
+        # Puzzle.play's budgets as in numzilla_batch, a game stopped by one is kept as unterminated.
+        # ctrl+c raises KeyboardInterrupt before the game is written
+        puzzle_kwargs.setdefault('debug', 0)
+        puzzle_kwargs.setdefault('max_width', Defaults.max_width)
+        puzzle_kwargs.setdefault('num_start_rows', Defaults.num_start_rows)
+        puzzle = Puzzle(rng=Random(seed), **puzzle_kwargs)
+        config = dumps(puzzle_kwargs['config'], sort_keys=True).encode() if puzzle_kwargs.get('config') else b''
+        grid = bytes(puzzle.values)
+        moves = bytearray()
+
+        def on_step(puzzle, _step, action, move):
+            if action == 'MATCH':
+                moves.extend(MATCH.pack(OP_MATCH, *move))
+            elif action == 'BUILD':
+                moves.append(OP_BUILD)
+            else:
+                moves.extend(SCRAMBLE.pack(OP_SCRAMBLE, puzzle.multiplier, len(puzzle.values)))
+                moves.extend(bytes(puzzle.values))
+
+        result = puzzle.play(on_step=on_step, selector=selector, **(limits or {}))
+        if result.status == 'interrupted':
+            raise KeyboardInterrupt
+        self._file.write(GAME.pack(
+            GAME.size + len(config) + len(grid) + len(moves), seed, puzzle_kwargs['max_width'], puzzle_kwargs['num_start_rows'],
+            len(config), len(grid), result.steps, result.max_rows, result.matches, result.builds, result.scrambles, result.score,
+            STATUSES.index(result.status), LIMITS.index(result.limit), result.repeats))
+        self._file.write(config)
+        self._file.write(grid)
+        self._file.write(moves)
+        self.games += 1
+        return result
+
+
+class TraceReader:
+
+    def __init__(self, path):
+        with open(path, 'rb') as trace:
+            self._map = mmap(trace.fileno(), 0, access=ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError('{0} is not a numzilla trace'.format(path))
+
+        # offsets of every game, hopping from header to header
+        self._offsets = []
+        offset = len(MAGIC)
+        unpack_length = Struct(FIELDS['length'][1]).unpack_from
+        while offset < len(self._map):
+            self._offsets.append(offset)
+            offset += unpack_length(self._map, offset)[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def close(self):
+        self._map.close()
+
+    def header(self, game):
+        header = GameHeader._make(GAME.unpack_from(self._map, self._offsets[game]))
+        return header._replace(status=STATUSES[header.status], limit=LIMITS[header.limit])
+
+    def headers(self):
+        for game in range(len(self._offsets)):
+            yield self.header(game)
+
+    def field(self, name):
+        # one header field of every game, nothing else is read (status and limit as stored)
+        offset, field_format = FIELDS[name]
+        unpack_from = Struct(field_format).unpack_from
+        return [unpack_from(self._map, start + offset)[0] for start in self._offsets]
+
+    def config(self, game):
+        # the config the game was played with, None for the defaults
+        start = self._offsets[game] + GAME.size
+        header = self.header(game)
+        return loads(self._map[start: start + header.config].decode()) if header.config else None
+
+    def grid(self, game):
+        start = self._offsets[game] + GAME.size
+        header = self.header(game)
+        return list(self._map[start + header.config: start + header.config + header.grid])
+
+    def moves(self, game):
+        start = self._offsets[game]
+        header = self.header(game)
+        offset = start + GAME.size + header.config + header.grid
+        end = start + header.length
+        while offset < end:
+            op = self._map[offset]
+            if op == OP_MATCH:
+                _, i1, i2 = MATCH.unpack_from(self._map, offset)
+                offset += MATCH.size
+                yield Move('MATCH', (i1, i2), None, None)
+            elif op == OP_BUILD:
+                offset += 1
+                yield Move('BUILD', None, None, None)
+            else:
+                _, multiplier, length = SCRAMBLE.unpack_from(self._map, offset)
+                offset += SCRAMBLE.size
+                yield Move('SCRAMBLE', None, multiplier, list(self._map[offset: offset + length]))
+                offset += length
+
+    def replay(self, game, on_step=None, **puzzle_kwargs):
+        # plays the recorded game back through Puzzle with the config it was played with,
+        # returning the finished puzzle. on_step is called as in Puzzle.play with the move
+        # number as the step. a recorded match that isn't one raises ValueError
+        header = self.header(game)
+        puzzle_kwargs.setdefault('debug', 0)
+        puzzle = Puzzle(max_width=header.max_width, num_start_rows=header.num_start_rows,
+                        values=self.grid(game), config=self.config(game), **puzzle_kwargs)
+        for step, move in enumerate(self.moves(game), 1):
+            if move.action == 'MATCH':
+                v1, v2 = (puzzle.values[index] for index in move.indices)
+                if v1 <= 0 or v2 <= 0 or not puzzle.is_match(v1, v2):
+                    raise ValueError('move {0} of game {1} is not a match, the trace does not fit the puzzle'.format(step, game))
+                puzzle.match_index(*move.indices)
+            elif move.action == 'BUILD':
+                puzzle.build()
+            else:
+                puzzle.scramble(values=move.values, multiplier=move.multiplier)
+            if on_step is not None:
+                on_step(puzzle, step, move.action, move.indices)
+        return puzzle
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='record numzilla games to a binary trace, or read one back')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help='play games and write them to a trace')
+    record.add_argument('path')
+    record.add_argument('games', type=int)
+    record.add_argument('--seed', type=int, default=0)
+    record.add_argument('--max-width', type=int, default=Defaults.max_width)
+    record.add_argument('--num-start-rows', type=int, default=Defaults.num_start_rows)
+    record.add_argument('--max-steps', type=int, default=None, help='steps before a game is stopped as unterminated')
+    record.add_argument('--time-budget', type=float, default=None, help='seconds before a game is stopped as unterminated')
+    record.add_argument('--max-repeats', type=int, default=None, help='scrambles dealing an earlier multiset of live values before a game is stopped')
+    commands.add_parser('summary', help='summarise every game in a trace').add_argument('path')
+    replay = commands.add_parser('replay', help='replay one game of a trace step by step')
+    replay.add_argument('path')
+    replay.add_argument('game', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        play_limits = {key: val for key, val in (('max_steps', args.max_steps),
+                                                 ('time_budget', args.time_budget),
+                                                 ('max_repeats', args.max_repeats)) if val is not None}
+        with TraceWriter(args.path) as writer:
+            for number in range(args.games):
+                writer.record(args.seed + number, limits=play_limits, max_width=args.max_width, num_start_rows=args.num_start_rows)
+        output('### TRACE: {0} GAMES WRITTEN TO {1}'.format(args.games, args.path))
+    elif args.command == 'summary':
+        with TraceReader(args.path) as reader:
+            output(summary(list(reader.headers())))
+    else:
+        with TraceReader(args.path) as reader:
+            reader.replay(args.game, debug=-1).display()